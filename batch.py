@@ -0,0 +1,277 @@
+"""
+Batch evaluation of board positions.
+
+A position is an H x W grid of revealed counts (0-8) with HIDDEN for cells
+not revealed and, optionally, MINE for cells known to be mines. A stack of
+N positions is evaluated without replaying any moves: the sentences are
+read straight off each grid, the AI's propagation and pairwise rules mark
+the forced safes and mines, and exact frontier enumeration gives every
+hidden cell's mine probability. Components are enumerated through one
+ComponentCache shared by the whole batch, so the components that recur
+across positions are solved once.
+
+Results are three arrays: mine probabilities (float32, NaN for revealed
+cells), forced cells (SAFE, FORCED_MINE or 0) and a status per position
+(EXACT, APPROXIMATE when a component is too large to enumerate and belief
+propagation was used instead, or INCONSISTENT). With output paths they are
+written to .npy files through memory maps as positions are solved, so
+inputs and outputs far larger than memory can be processed; the input can
+itself be a memory-mapped .npy file.
+
+    python batch.py positions.npy --mines 99 --output probabilities.npy --forced forced.npy
+"""
+import argparse
+import multiprocessing
+import sys
+
+import numpy as np
+
+from board import neighbor_counts
+from minesweeper import MinesweeperAI
+from probability import (MAX_COMPONENT_CELLS, ComponentCache, InconsistentKnowledge,
+                         belief_propagation, exact_probabilities)
+
+# Input grid values besides the counts 0-8
+HIDDEN = -1
+MINE = -2
+
+# Forced cell values
+SAFE = 1
+FORCED_MINE = 2
+
+# Position status values
+EXACT = 0
+APPROXIMATE = 1
+INCONSISTENT = 2
+
+
+class BatchEvaluator:
+    """
+    Evaluates positions with shared caches. inference runs the pairwise
+    rules to a fixed point before enumeration; exact enumeration alone also
+    finds every forced cell of components it can enumerate.
+    """
+    def __init__(self, max_cells=MAX_COMPONENT_CELLS, cache_size=65536, inference=True):
+        self.max_cells = max_cells
+        self.cache = ComponentCache(cache_size)
+        self.inference = inference
+
+    def position_ai(self, grid, mines):
+        """
+        MinesweeperAI holding the knowledge of a position, built directly
+        from the grid, or None if a count contradicts its neighbours.
+        """
+        height, width = grid.shape
+        hidden = grid == HIDDEN
+        known_mines = grid == MINE
+        unknown = hidden | known_mines
+        around = neighbor_counts(unknown)
+        mines_around = neighbor_counts(known_mines)
+        revealed = grid >= 0
+        if ((grid < MINE) | (grid > 8)).any() or (
+                revealed & ((grid > around) | (grid < mines_around))).any():
+            return None
+        boundary = revealed & (around > 0)
+        # Counts satisfied by known mines make their hidden neighbours safe,
+        # and counts equal to their unknown neighbours make them all mines;
+        # marking those first keeps most sentences out of the knowledge base
+        left = np.where(boundary, grid.astype(np.int16) - mines_around, -1)
+        safe = hidden & (neighbor_counts(left == 0) > 0)
+        mined = hidden & (neighbor_counts(boundary & (grid == around)) > 0)
+        if (safe & mined).any():
+            return None
+        ai = MinesweeperAI(height=height, width=width, mines=mines)
+        ai.component_cache = self.cache
+        # Cells as tuples of Python ints, which the bitmasks need
+        ai.movesMade = set(map(tuple, np.argwhere(revealed).tolist()))
+        ai.safeMoves = ai.movesMade | set(map(tuple, np.argwhere(safe).tolist()))
+        ai.unrevealed = set(map(tuple, np.argwhere(hidden & ~mined).tolist()))
+        ai.mines = set(map(tuple, np.argwhere(known_mines | mined).tolist()))
+        for cell in ai.safeMoves - ai.movesMade:
+            ai.pending_safes.add(cell)
+        for i, j in np.argwhere(boundary & (left != 0) & (grid != around)).tolist():
+            cells = {(y, x) for y in range(max(0, i - 1), min(height, i + 2))
+                     for x in range(max(0, j - 1), min(width, j + 2)) if unknown[y, x]}
+            ai.add_sentence(cells, int(grid[i, j]))
+        ai.update_knowledge()
+        return ai
+
+    def evaluate(self, grid, mines):
+        """
+        Evaluate one position with mines mines in total. Returns
+        (probabilities, forced, status).
+        """
+        grid = np.asarray(grid)
+        probabilities = np.full(grid.shape, np.nan, dtype=np.float32)
+        forced = np.zeros(grid.shape, dtype=np.int8)
+        ai = self.position_ai(grid, int(mines))
+        if ai is None:
+            return probabilities, forced, INCONSISTENT
+        if self.inference:
+            while ai.pair_inference():
+                pass
+        # Propagation drops sentences the others contradict, and may mark a
+        # cell both safe and a mine
+        if ai.knowledge.contradictions or not ai.mines.isdisjoint(ai.safeMoves):
+            return probabilities, forced, INCONSISTENT
+        for cell in ai.mines:
+            forced[cell] = FORCED_MINE
+            probabilities[cell] = 1.0
+        for cell in ai.safeMoves - ai.movesMade:
+            forced[cell] = SAFE
+            probabilities[cell] = 0.0
+        unknown = [cell for cell in ai.unrevealed if cell not in ai.safeMoves]
+        mines_left = ai.totalMines - len(ai.mines)
+        if not 0 <= mines_left <= len(unknown):
+            return probabilities, forced, INCONSISTENT
+        status = EXACT
+        try:
+            estimate = exact_probabilities(ai.knowledge, unknown, mines_left, self.max_cells,
+                                           cache=self.cache, strict=True)
+        except InconsistentKnowledge:
+            return probabilities, forced, INCONSISTENT
+        if estimate is None:
+            status = APPROXIMATE
+            estimate, _ = belief_propagation(ai.knowledge, unknown, mines_left)
+        for cell, p in estimate.items():
+            probabilities[cell] = p
+            if status == EXACT and p in (0.0, 1.0):
+                forced[cell] = FORCED_MINE if p else SAFE
+        return probabilities, forced, status
+
+    def evaluate_batch(self, grids, mines, probabilities=None, forced=None, status=None):
+        """
+        Evaluate a stack of positions of shape (N, H, W); mines is a total
+        for every position or a sequence of N totals. Results are written
+        into the given output arrays, which may be memory maps, or new
+        arrays. Returns (probabilities, forced, status).
+        """
+        grids = np.asarray(grids) if not isinstance(grids, np.ndarray) else grids
+        probabilities, forced, status = _outputs(grids.shape, probabilities, forced, status)
+        totals = np.broadcast_to(np.asarray(mines), (grids.shape[0],))
+        for index in range(grids.shape[0]):
+            probabilities[index], forced[index], status[index] = self.evaluate(
+                grids[index], totals[index])
+        return probabilities, forced, status
+
+
+def _outputs(shape, probabilities=None, forced=None, status=None):
+    if probabilities is None:
+        probabilities = np.empty(shape, dtype=np.float32)
+    if forced is None:
+        forced = np.empty(shape, dtype=np.int8)
+    if status is None:
+        status = np.empty(shape[0], dtype=np.int8)
+    return probabilities, forced, status
+
+
+def open_outputs(shape, output, forced_output=None):
+    """
+    Memory-mapped .npy outputs for positions of the given (N, H, W) shape:
+    probabilities at output, forced cells at forced_output (or in memory
+    if None) and the status next to output with a .status.npy suffix.
+    """
+    probabilities = np.lib.format.open_memmap(output, mode="w+", dtype=np.float32, shape=shape)
+    forced = None
+    if forced_output is not None:
+        forced = np.lib.format.open_memmap(forced_output, mode="w+", dtype=np.int8, shape=shape)
+    stem = output[:-4] if output.endswith(".npy") else output
+    status = np.lib.format.open_memmap(stem + ".status.npy", mode="w+", dtype=np.int8,
+                                       shape=shape[:1])
+    return _outputs(shape, probabilities, forced, status)
+
+
+_evaluator = None
+
+
+def _worker_init(options):
+    global _evaluator
+    _evaluator = BatchEvaluator(**options)
+
+
+def _evaluate_chunk(args):
+    start, grids, totals = args
+    return start, _evaluator.evaluate_batch(grids, totals)
+
+
+def evaluate_batch(grids, mines, output=None, forced_output=None, workers=1, chunk_size=256,
+                   flush_every=4096, **options):
+    """
+    Evaluate a stack of positions. options are BatchEvaluator arguments.
+    With output, results are streamed to memory-mapped .npy files (see
+    open_outputs) and flushed every flush_every positions. With several
+    workers, chunks of chunk_size positions are evaluated on a process
+    pool, each worker with its own cache. Returns (probabilities, forced,
+    status).
+    """
+    grids = np.asarray(grids) if not isinstance(grids, np.ndarray) else grids
+    if grids.ndim != 3:
+        raise ValueError(f"expected an (N, H, W) stack of grids, got shape {grids.shape}")
+    if output is not None:
+        probabilities, forced, status = open_outputs(grids.shape, output, forced_output)
+    else:
+        probabilities, forced, status = _outputs(grids.shape)
+    totals = np.broadcast_to(np.asarray(mines), (grids.shape[0],))
+    chunks = ((start, np.array(grids[start:start + chunk_size]), totals[start:start + chunk_size])
+              for start in range(0, grids.shape[0], chunk_size))
+    if workers == 1:
+        _worker_init(options)
+        results = map(_evaluate_chunk, chunks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers or None, _worker_init, (options,))
+        results = pool.imap_unordered(_evaluate_chunk, chunks)
+    try:
+        unflushed = 0
+        for start, (chunk_probabilities, chunk_forced, chunk_status) in results:
+            end = start + len(chunk_status)
+            probabilities[start:end] = chunk_probabilities
+            forced[start:end] = chunk_forced
+            status[start:end] = chunk_status
+            unflushed += len(chunk_status)
+            if output is not None and unflushed >= flush_every:
+                _flush(probabilities, forced, status)
+                unflushed = 0
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if output is not None:
+        _flush(probabilities, forced, status)
+    return probabilities, forced, status
+
+
+def _flush(*arrays):
+    for array in arrays:
+        if isinstance(array, np.memmap):
+            array.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a stack of Minesweeper positions.")
+    parser.add_argument("positions", help=f".npy file of shape (N, H, W); {HIDDEN} marks hidden "
+                                          f"cells and {MINE} known mines")
+    parser.add_argument("--mines", type=int, required=True, help="total mines of every position")
+    parser.add_argument("--output", required=True, help=".npy file for the probabilities")
+    parser.add_argument("--forced", help=".npy file for the forced cells")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, 0 for one per CPU (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="positions per worker task")
+    parser.add_argument("--max-cells", type=int, default=MAX_COMPONENT_CELLS,
+                        help="largest component enumerated exactly")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grids = np.load(args.positions, mmap_mode="r")
+    options = {"max_cells": args.max_cells}
+    _, _, status = evaluate_batch(grids, args.mines, args.output, args.forced, args.workers,
+                                  args.chunk_size, **options)
+    counts = np.bincount(status, minlength=3)
+    print(f"{len(status)} positions: {counts[EXACT]} exact, {counts[APPROXIMATE]} approximate, "
+          f"{counts[INCONSISTENT]} inconsistent", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,653 @@
+"""
+Headless benchmark harness for the Minesweeper AI.
+
+Plays games of Minesweeper against MinesweeperAI without pygame and reports
+win rate, games/sec, smart_move latency percentiles and the time spent in
+each smart_move stage. Games can be sharded across a process pool; every game
+gets its own random.Random seeded from (seed, game index), so results do not
+depend on the number of workers.
+
+    python benchmark.py --games 1000 --height 16 --width 16 --mines 40 --seed 1
+    python benchmark.py --games 1000000 --workers 0 --seed 1
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+import tracemalloc
+
+from gametrace import GameTrace, TraceWriter
+from instrumentation import StageTotals
+from minesweeper import Minesweeper, MinesweeperAI
+from probability import belief_propagation, exact_probabilities
+from sat import CardinalitySolver
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with constant memory, so percentiles can
+    be reported for any number of moves and histograms can be merged.
+    """
+    BUCKETS_PER_DECADE = 20
+    MIN_SECONDS = 1e-7
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = int(math.log10(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DECADE) + 1
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p-th percentile, in seconds.
+        """
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                upper = self.MIN_SECONDS * 10 ** (bucket / self.BUCKETS_PER_DECADE)
+                return min(upper, self.max)
+        return self.max
+
+
+class BenchmarkStats(StageTotals):
+    """
+    Aggregated results of a batch of games. It is also the instrument
+    attached to every MinesweeperAI, so move latency and stage timings come
+    from the AI's own move records; if records is a writable stream, each
+    record is also written to it as a JSON line.
+    """
+    def __init__(self, records=None):
+        super().__init__()
+        self.records = records
+        self.games = 0
+        self.wins = 0
+        self.losses = 0
+        self.stuck = 0
+        self.moves = 0
+        self.elapsed = 0.0
+        self.latency = LatencyHistogram()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.truncated = 0
+        self.knowledge_peak = 0
+        self.knowledge_pruned = {"duplicates": 0, "subsumed": 0, "evicted": 0}
+
+    def __getstate__(self):
+        # The record stream stays in the process that owns it
+        state = dict(self.__dict__)
+        state["records"] = None
+        return state
+
+    def move(self, record):
+        super().move(record)
+        self.moves += 1
+        self.latency.add(record["seconds"])
+        self.truncated += record["truncated"]
+        if record["cache"]:
+            self.cache_hits += record["cache"][0]
+            self.cache_misses += record["cache"][1]
+        if self.records is not None:
+            self.records.write(json.dumps(record) + "\n")
+
+    def add_knowledge(self, knowledge_stats):
+        """
+        Add the KnowledgeBase.stats() of a finished game.
+        """
+        self.knowledge_peak = max(self.knowledge_peak, knowledge_stats["peak"])
+        for name in self.knowledge_pruned:
+            self.knowledge_pruned[name] += knowledge_stats[name]
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins += other.wins
+        self.losses += other.losses
+        self.stuck += other.stuck
+        self.moves += other.moves
+        self.elapsed += other.elapsed
+        self.latency.merge(other.latency)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.truncated += other.truncated
+        self.knowledge_peak = max(self.knowledge_peak, other.knowledge_peak)
+        for name, count in other.knowledge_pruned.items():
+            self.knowledge_pruned[name] += count
+        for stage, seconds in other.stage_times.items():
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+        for stage, count in other.stage_calls.items():
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + count
+        for stage, count in other.stage_moves.items():
+            self.stage_moves[stage] = self.stage_moves.get(stage, 0) + count
+
+    def summary(self, wall_time=None):
+        """
+        Return the statistics as a JSON-serialisable dict. wall_time is the
+        real time the batch took; it defaults to the summed game time.
+        """
+        wall_time = self.elapsed if wall_time is None else wall_time
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "losses": self.losses,
+            "stuck": self.stuck,
+            "win_rate": self.wins / self.games if self.games else 0.0,
+            "moves": self.moves,
+            "truncated_moves": self.truncated,
+            "wall_time": wall_time,
+            "games_per_sec": self.games / wall_time if wall_time else 0.0,
+            "latency_ms": {
+                "p50": self.latency.percentile(50) * 1000,
+                "p90": self.latency.percentile(90) * 1000,
+                "p99": self.latency.percentile(99) * 1000,
+                "max": self.latency.max * 1000,
+            },
+            "stage_times": dict(sorted(self.stage_times.items())),
+            "stage_calls": dict(sorted(self.stage_calls.items())),
+            "stage_moves": dict(sorted(self.stage_moves.items())),
+            "component_cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            },
+            "knowledge": dict(self.knowledge_pruned, peak=self.knowledge_peak),
+        }
+
+
+def format_report(summary):
+    lines = [
+        f"Games:     {summary['games']}  (won {summary['wins']}, lost {summary['losses']}, stuck {summary['stuck']})",
+        f"Win rate:  {summary['win_rate']:.2%}",
+        f"Speed:     {summary['games_per_sec']:.1f} games/sec, {summary['moves']} moves in {summary['wall_time']:.2f}s"
+        f" ({summary['truncated_moves']} cut short by the deadline)",
+        "Latency:   " + ", ".join(f"{name} {ms:.3f}ms" for name, ms in summary["latency_ms"].items()),
+        f"Cache:     {summary['component_cache']['hits']} hits, "
+        f"{summary['component_cache']['misses']} misses "
+        f"({summary['component_cache']['hit_rate']:.1%}) for enumerated components",
+        f"Knowledge: peak {summary['knowledge']['peak']} sentences; "
+        f"{summary['knowledge']['duplicates']} duplicates, {summary['knowledge']['subsumed']} implied "
+        f"and {summary['knowledge']['evicted']} evicted sentences dropped",
+        "Stages:",
+    ]
+    total = sum(summary["stage_times"].values()) or 1.0
+    for stage, seconds in summary["stage_times"].items():
+        moves = summary["stage_moves"].get(stage, 0)
+        calls = summary["stage_calls"].get(stage, 0)
+        lines.append(f"  {stage:<16} {seconds:9.3f}s {seconds / total:7.1%}  {calls} calls  {moves} moves")
+    return "\n".join(lines)
+
+
+def mines_for(height, width, mines=None, density=None):
+    """
+    Resolve the mine count from an explicit count or a density in (0, 1).
+    """
+    if mines is None:
+        mines = round(height * width * (density if density is not None else 0.123))
+    if not 0 <= mines < height * width:
+        raise ValueError(f"cannot place {mines} mines on a {height}x{width} board")
+    return mines
+
+
+def game_seed(seed, index):
+    """
+    Seed of game number index in a run seeded with seed.
+    """
+    return seed * 2 ** 32 + index
+
+
+def play_game(height, width, mines, first_move, stats, rng=None, board_class=Minesweeper,
+              ai_options=None, before_move=None, seed=None, trace=None, board_options=None):
+    """
+    Play one game on a board_class board and add its result to stats.
+    ai_options are attributes set on the MinesweeperAI before play and
+    board_options extra arguments of board_class, such as opening;
+    before_move, if given, is called with the AI before every smart_move.
+    With a trace (a TraceWriter) the game is written to it when it ends;
+    seed is the seed rng was created from, recorded so the game can be
+    replayed exactly.
+    """
+    rng = rng if rng is not None else random.Random()
+    board_options = board_options or {}
+    game = board_class(height=height, width=width, mines=mines, safe_cell=first_move, rng=rng,
+                       **board_options)
+    ai = MinesweeperAI(height=height, width=width, mines=mines, rng=rng)
+    for name, value in (ai_options or {}).items():
+        setattr(ai, name, value)
+    ai.instrument = stats
+    record = None
+    if trace is not None:
+        record = GameTrace(height, width, mines, first_move, game.mines, seed, board_class.__name__,
+                           board_options.get("opening", False))
+    safe_cells = height * width - mines
+    revealed = set()
+    lost = False
+    start = time.perf_counter()
+    move = first_move
+    decision = ("first", 0.0, 0.0)
+    while True:
+        cells = game.reveal(move)
+        if record is not None:
+            record.add_move(move, decision[0], len(cells) if cells else 0, decision[1], decision[2])
+        if cells is None:
+            lost = True
+            break
+        revealed.update(cell for cell, _ in cells)
+        ai.add_knowledge_batch(cells)
+        if len(revealed) == safe_cells:
+            break
+        if before_move is not None:
+            before_move(ai)
+        move_start = time.perf_counter()
+        move = ai.smart_move()
+        if move is None or move in revealed:
+            break
+        decision = (ai.last_stage, time.perf_counter() - move_start, ai.probability(move))
+    stats.elapsed += time.perf_counter() - start
+    stats.games += 1
+    stats.add_knowledge(ai.knowledge.stats())
+    if lost:
+        stats.losses += 1
+    elif len(revealed) == safe_cells:
+        stats.wins += 1
+    else:
+        stats.stuck += 1
+    if record is not None:
+        record.result = "lost" if lost else "won" if len(revealed) == safe_cells else "stuck"
+        trace.write(record)
+
+
+class EngineComparison:
+    """
+    Compares belief propagation marginals against exact enumeration on the
+    positions reached while playing.
+    """
+    def __init__(self):
+        self.positions = 0
+        self.cells = 0
+        self.abs_error = 0.0
+        self.max_error = 0.0
+        self.converged = 0
+        self.same_choice = 0
+        self.exact_time = 0.0
+        self.bp_time = 0.0
+
+    def __call__(self, ai):
+        candidates = [cell for cell in ai.get_unrevealed() if cell not in ai.pending_safes]
+        if not candidates or not len(ai.knowledge):
+            return
+        mines_left = ai.totalMines - len(ai.mines)
+        start = time.perf_counter()
+        exact = exact_probabilities(ai.knowledge, candidates, mines_left, ai.max_component_cells)
+        self.exact_time += time.perf_counter() - start
+        if exact is None:
+            return
+        start = time.perf_counter()
+        approximate, converged = belief_propagation(ai.knowledge, candidates, mines_left)
+        self.bp_time += time.perf_counter() - start
+        self.positions += 1
+        self.converged += converged
+        for cell, p in exact.items():
+            error = abs(approximate[cell] - p)
+            self.abs_error += error
+            self.max_error = max(self.max_error, error)
+        self.cells += len(exact)
+        choice = min(approximate, key=lambda cell: approximate[cell])
+        self.same_choice += exact[choice] == min(exact.values())
+
+    def summary(self):
+        positions = self.positions or 1
+        return {
+            "positions": self.positions,
+            "mean_abs_error": self.abs_error / (self.cells or 1),
+            "max_error": self.max_error,
+            "bp_converged": self.converged / positions,
+            "bp_choice_optimal": self.same_choice / positions,
+            "exact_ms": self.exact_time / positions * 1000,
+            "bp_ms": self.bp_time / positions * 1000,
+        }
+
+
+def compare_engines(games, height=9, width=9, mines=10, first_move=(3, 3), seed=0,
+                    board_class=Minesweeper, ai_options=None, board_options=None):
+    """
+    Play games serially and compare belief propagation with exact
+    enumeration before every move. Returns the EngineComparison summary.
+    """
+    comparison = EngineComparison()
+    stats = BenchmarkStats()
+    for index in range(games):
+        rng = random.Random(game_seed(seed, index))
+        play_game(height, width, mines, first_move, stats, rng, board_class, ai_options,
+                  before_move=comparison, board_options=board_options)
+    return comparison.summary()
+
+
+class InferenceComparison:
+    """
+    Compares the pairwise rules with the cardinality solver on the positions
+    reached while playing: how many of the solver's forced cells the rules
+    also find, and what each costs.
+    """
+    def __init__(self, node_limit=100000):
+        self.solver = CardinalitySolver(node_limit)
+        self.positions = 0
+        self.sat_forced = 0
+        self.rules_forced = 0
+        self.rules_incomplete = 0
+        self.sat_time = 0.0
+        self.rules_time = 0.0
+
+    def __call__(self, ai):
+        if not len(ai.knowledge):
+            return
+        start = time.perf_counter()
+        safes, mines = self.solver.forced(ai.knowledge)
+        self.sat_time += time.perf_counter() - start
+        # Run the rules to a fixed point, then undo what they found
+        checkpoint = ai.checkpoint()
+        known = len(ai.safeMoves) + len(ai.mines)
+        start = time.perf_counter()
+        while ai.pair_inference():
+            pass
+        self.rules_time += time.perf_counter() - start
+        found = len(ai.safeMoves) + len(ai.mines) - known
+        ai.rollback(checkpoint)
+        self.positions += 1
+        self.sat_forced += len(safes) + len(mines)
+        self.rules_forced += found
+        self.rules_incomplete += found < len(safes) + len(mines)
+
+    def summary(self):
+        positions = self.positions or 1
+        return {
+            "positions": self.positions,
+            "sat_forced": self.sat_forced,
+            "rules_forced": self.rules_forced,
+            "rules_completeness": self.rules_forced / self.sat_forced if self.sat_forced else 1.0,
+            "positions_rules_missed": self.rules_incomplete,
+            "sat_queries": self.solver.queries,
+            "sat_nodes": self.solver.nodes,
+            "sat_ms": self.sat_time / positions * 1000,
+            "rules_ms": self.rules_time / positions * 1000,
+        }
+
+
+def compare_inference(games, height=9, width=9, mines=10, first_move=(3, 3), seed=0,
+                      board_class=Minesweeper, ai_options=None, board_options=None):
+    """
+    Play games serially and compare the pairwise rules with the cardinality
+    solver before every move. Returns the InferenceComparison summary.
+    """
+    comparison = InferenceComparison()
+    stats = BenchmarkStats()
+    for index in range(games):
+        rng = random.Random(game_seed(seed, index))
+        play_game(height, width, mines, first_move, stats, rng, board_class, ai_options,
+                  before_move=comparison, board_options=board_options)
+    return comparison.summary()
+
+
+def run_benchmark(games, height=9, width=9, mines=10, first_move=(3, 3), seed=0, start=0,
+                  board_class=Minesweeper, ai_options=None, board_options=None, records=None,
+                  trace=None):
+    """
+    Play games start .. start + games - 1 of a seeded run serially and
+    return their BenchmarkStats. Move records are written to the records
+    stream as JSON lines if one is given, and every game to trace, a
+    TraceWriter, if one is given.
+    """
+    stats = BenchmarkStats(records)
+    for index in range(start, start + games):
+        rng = random.Random(game_seed(seed, index))
+        play_game(height, width, mines, first_move, stats, rng, board_class, ai_options,
+                  seed=game_seed(seed, index), trace=trace, board_options=board_options)
+    return stats
+
+
+def _run_chunk(args):
+    return run_benchmark(*args)
+
+
+def iter_parallel(games, height=9, width=9, mines=10, first_move=(3, 3), seed=0,
+                  workers=None, chunk_size=100, board_class=Minesweeper, ai_options=None,
+                  board_options=None):
+    """
+    Shard games across a process pool, yielding the running BenchmarkStats
+    as each chunk of chunk_size games finishes. Only per-chunk aggregates
+    cross process boundaries, so memory does not grow with games.
+    """
+    chunks = ((min(chunk_size, games - start), height, width, mines, first_move, seed, start,
+               board_class, ai_options, board_options)
+              for start in range(0, games, chunk_size))
+    stats = BenchmarkStats()
+    with multiprocessing.Pool(workers) as pool:
+        for chunk in pool.imap_unordered(_run_chunk, chunks):
+            stats.merge(chunk)
+            yield stats
+
+
+def run_parallel(games, height=9, width=9, mines=10, first_move=(3, 3), seed=0,
+                 workers=None, chunk_size=100, board_class=Minesweeper, ai_options=None,
+                 board_options=None):
+    """
+    Play games on a process pool and return the merged BenchmarkStats.
+    """
+    stats = BenchmarkStats()
+    for stats in iter_parallel(games, height, width, mines, first_move, seed, workers, chunk_size,
+                               board_class, ai_options, board_options):
+        pass
+    return stats
+
+
+def peak_memory(games, height, width, mines, first_move, seed=0, board_class=Minesweeper,
+                ai_options=None, board_options=None):
+    """
+    Play the first games of a seeded run under tracemalloc. Returns the
+    peak traced bytes and the number of moves played. Kept apart from timed
+    runs because tracing slows every allocation.
+    """
+    traced = BenchmarkStats()
+    tracemalloc.start()
+    try:
+        for index in range(games):
+            play_game(height, width, mines, first_move, traced,
+                      random.Random(game_seed(seed, index)), board_class, ai_options,
+                      board_options=board_options)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, traced.moves
+
+
+def iter_scaling(sizes, games=1, density=None, seed=0, board_class=Minesweeper, ai_options=None,
+                 opening=True, memory=True):
+    """
+    Play games on square boards of each size in sizes, yielding one result
+    dict per size as soon as it is done. The first move is the centre cell;
+    with opening it is also clear of nearby mines. With memory, the first
+    game is played again to measure peak memory (see peak_memory).
+    """
+    board_options = {"opening": opening}
+    for size in sizes:
+        mines = mines_for(size, size, density=density)
+        first_move = (size // 2, size // 2)
+        stats = run_benchmark(games, size, size, mines, first_move, seed,
+                              board_class=board_class, ai_options=ai_options,
+                              board_options=board_options)
+        row = {
+            "size": size,
+            "mines": mines,
+            "games": stats.games,
+            "win_rate": stats.wins / stats.games if stats.games else 0.0,
+            "moves": stats.moves,
+            "ms_per_move": stats.elapsed / stats.moves * 1000 if stats.moves else 0.0,
+            "p99_ms": stats.latency.percentile(99) * 1000,
+            "max_ms": stats.latency.max * 1000,
+            "peak_sentences": stats.knowledge_peak,
+        }
+        if memory:
+            peak, moves = peak_memory(1, size, size, mines, first_move, seed, board_class,
+                                      ai_options, board_options)
+            row["peak_mb"] = peak / 2 ** 20
+            row["kb_per_move"] = peak / 1024 / moves if moves else 0.0
+        yield row
+
+
+def format_scaling_row(row):
+    line = (f"{row['size']:>5}x{row['size']:<5} {row['mines']:>7} mines  {row['games']} games  "
+            f"win {row['win_rate']:6.1%}  {row['moves']:>8} moves  {row['ms_per_move']:8.3f} ms/move  "
+            f"p99 {row['p99_ms']:8.3f}ms  max {row['max_ms']:9.3f}ms  "
+            f"{row['peak_sentences']:>6} sentences")
+    if "peak_mb" in row:
+        line += f"  peak {row['peak_mb']:8.1f}MB  {row['kb_per_move']:7.2f}KB/move"
+    return line
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Minesweeper AI without a display.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--height", type=int, default=9)
+    parser.add_argument("--width", type=int, default=9)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--mines", type=int, help="number of mines (default 10 on 9x9)")
+    group.add_argument("--density", type=float, help="fraction of cells that are mines")
+    parser.add_argument("--first-move", type=int, nargs=2, metavar=("I", "J"),
+                        help="first cell revealed, guaranteed safe (default (3, 3) clipped to the board)")
+    parser.add_argument("--opening", action="store_true",
+                        help="keep the first move's neighbours free of mines, so it opens an area")
+    parser.add_argument("--seed", type=int, help="seed for reproducible boards and guesses (default random)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, 0 for one per CPU (default 1, no pool)")
+    parser.add_argument("--chunk-size", type=int, default=100, help="games per worker task")
+    parser.add_argument("--progress", action="store_true", help="report running totals to stderr")
+    parser.add_argument("--array-board", action="store_true",
+                        help="use the NumPy-backed ArrayMinesweeper board (requires numpy)")
+    parser.add_argument("--simulations", type=int, help="Monte Carlo samples per guess (default 10000)")
+    parser.add_argument("--simulation-time", type=float, help="Monte Carlo time budget per guess in seconds")
+    parser.add_argument("--batched-sampling", action="store_true",
+                        help="draw Monte Carlo samples in NumPy batches (requires numpy)")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="time budget per smart_move; late moves use the best estimate so far")
+    parser.add_argument("--max-sentences", type=int, metavar="N",
+                        help="cap the knowledge base; derived sentences are evicted above it")
+    parser.add_argument("--records", metavar="FILE",
+                        help="write one JSON line per smart_move (serial runs only)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a binary trace of every game for replay.py (serial runs only)")
+    parser.add_argument("--compare-engines", action="store_true",
+                        help="compare belief propagation with exact enumeration at every move")
+    parser.add_argument("--sat", action="store_true",
+                        help="add the cardinality solver inference stage")
+    parser.add_argument("--compare-inference", action="store_true",
+                        help="compare the pairwise rules with the cardinality solver at every move")
+    parser.add_argument("--scaling", type=int, nargs="+", metavar="N",
+                        help="time and measure memory on N x N boards for each N, using --games,"
+                             " --density (default 0.123) and an opening first move in the centre")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced memory game of --scaling")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def ai_options_from(args):
+    """
+    MinesweeperAI attributes selected on the command line.
+    """
+    options = {}
+    if args.simulations is not None:
+        options["simulations"] = args.simulations
+    if args.simulation_time is not None:
+        options["simulation_time"] = args.simulation_time
+    if args.batched_sampling:
+        options["batched_sampling"] = True
+    if args.sat:
+        options["sat_solver"] = CardinalitySolver()
+    if args.deadline is not None:
+        options["move_deadline"] = args.deadline
+    if args.max_sentences is not None:
+        options["max_sentences"] = args.max_sentences
+    return options
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ai_options = ai_options_from(args)
+    if args.mines is None and args.density is None and (args.height, args.width) == (9, 9):
+        args.mines = 10
+    mines = mines_for(args.height, args.width, args.mines, args.density)
+    first_move = tuple(args.first_move) if args.first_move else (min(3, args.height - 1), min(3, args.width - 1))
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    board_class = Minesweeper
+    if args.array_board:
+        from board import ArrayMinesweeper
+        board_class = ArrayMinesweeper
+    board_options = {"opening": True} if args.opening else None
+    start = time.perf_counter()
+    if args.scaling:
+        for row in iter_scaling(args.scaling, args.games, args.density, seed, board_class, ai_options,
+                                memory=not args.no_memory):
+            print(json.dumps(row) if args.json else format_scaling_row(row), flush=True)
+        return
+    if args.compare_engines:
+        summary = compare_engines(args.games, args.height, args.width, mines, first_move, seed,
+                                  board_class, ai_options, board_options)
+        print(json.dumps(summary, indent=2))
+        return
+    if args.compare_inference:
+        summary = compare_inference(args.games, args.height, args.width, mines, first_move, seed,
+                                    board_class, ai_options, board_options)
+        print(json.dumps(summary, indent=2))
+        return
+    if (args.records or args.trace) and args.workers != 1:
+        raise SystemExit("--records and --trace require --workers 1")
+    if args.trace and not 0 <= seed < 2 ** 32:
+        # Traces store the per-game seeds (game_seed) as 64-bit integers
+        raise SystemExit("--trace requires a --seed from 0 to 2**32 - 1")
+    if args.workers == 1:
+        records = open(args.records, "w") if args.records else None
+        trace_file = open(args.trace, "wb") if args.trace else None
+        try:
+            stats = run_benchmark(args.games, args.height, args.width, mines, first_move, seed,
+                                  board_class=board_class, ai_options=ai_options,
+                                  board_options=board_options, records=records,
+                                  trace=TraceWriter(trace_file) if trace_file else None)
+        finally:
+            if records is not None:
+                records.close()
+            if trace_file is not None:
+                trace_file.close()
+    else:
+        stats = BenchmarkStats()
+        workers = args.workers or None
+        for stats in iter_parallel(args.games, args.height, args.width, mines, first_move, seed,
+                                   workers, args.chunk_size, board_class, ai_options,
+                                   board_options):
+            if args.progress:
+                print(f"{stats.games}/{args.games} games, {stats.wins} won", file=sys.stderr)
+    summary = stats.summary(time.perf_counter() - start)
+    summary["seed"] = seed
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Bitmask encoding of cell sets.
+
+Cell (i, j) of a board of the given width is bit i * width + j of an
+arbitrary-precision int, so a set of cells is a single int: intersection,
+difference and subset tests become &, & ~ and comparisons, and set sizes
+are popcounts (int.bit_count).
+
+On large boards a mask of nearby cells would still be as long as the board,
+so masks can be taken relative to an offset: bit k then stands for cell
+number offset + k. Masks with different offsets are aligned by shifting.
+"""
+
+
+def cell_index(cell, width):
+    return cell[0] * width + cell[1]
+
+
+def cell_bit(cell, width, offset=0):
+    return 1 << (cell[0] * width + cell[1] - offset)
+
+
+def cells_to_mask(cells, width, offset=0):
+    mask = 0
+    for i, j in cells:
+        mask |= 1 << (i * width + j - offset)
+    return mask
+
+
+def mask_to_cells(mask, width, offset=0):
+    """
+    Cells whose bits are set in mask, lowest bit first.
+    """
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(divmod(low.bit_length() - 1 + offset, width))
+        mask ^= low
+    return cells
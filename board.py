@@ -0,0 +1,72 @@
+"""
+Array-backed Minesweeper board.
+
+ArrayMinesweeper has the same interface as Minesweeper but keeps the board
+in NumPy arrays: mines are placed with a single choice without replacement
+and the neighbour count of every cell is computed once with shifted sums,
+so nearby_mines is an O(1) lookup. Boards of 1000x1000 and more are
+generated in milliseconds.
+"""
+import random
+
+import numpy as np
+
+from minesweeper import Minesweeper, excluded_cells
+
+
+def neighbor_counts(board):
+    """
+    Number of mines around every cell of a boolean mine array.
+    """
+    height, width = board.shape
+    padded = np.zeros((height + 2, width + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = board
+    counts = np.zeros((height, width), dtype=np.uint8)
+    for di in range(3):
+        for dj in range(3):
+            if di != 1 or dj != 1:
+                counts += padded[di:di + height, dj:dj + width]
+    return counts
+
+
+class ArrayMinesweeper(Minesweeper):
+    """
+    Minesweeper game representation backed by NumPy arrays
+    """
+    def __init__(self, height=8, width=8, mines=5, safe_cell=(3, 3), rng=None, opening=False):
+        self.height = height
+        self.width = width
+        self.totalMines = mines
+        self.safe_cell = safe_cell
+        # Accept a random.Random as well, so callers can share one seed
+        if rng is None or isinstance(rng, random.Random):
+            rng = np.random.default_rng(None if rng is None else rng.getrandbits(64))
+        self.rng = rng
+        cells = height * width
+        excluded = sorted(i * width + j for i, j in excluded_cells(height, width, safe_cell, opening)
+                          if 0 <= i < height and 0 <= j < width)
+        if mines > cells - len(excluded):
+            raise ValueError(f"{mines} mines do not fit on a {height}x{width} board")
+        # Draw from the allowed cells, then shift past each excluded cell in turn
+        positions = rng.choice(cells - len(excluded), size=mines, replace=False)
+        for index in excluded:
+            positions += positions >= index
+        self.board = np.zeros((height, width), dtype=bool)
+        self.board.flat[positions] = True
+        self.counts = neighbor_counts(self.board)
+        self._mines = None
+        self.mines_found = set()
+        self.revealed = set()
+
+    @property
+    def mines(self):
+        # Built on first use, large boards rarely need the set
+        if self._mines is None:
+            self._mines = set(zip(*(index.tolist() for index in np.nonzero(self.board))))
+        return self._mines
+
+    def is_mine(self, cell):
+        return bool(self.board[cell])
+
+    def nearby_mines(self, cell):
+        return int(self.counts[cell])
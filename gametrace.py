@@ -0,0 +1,144 @@
+"""
+Compact binary game traces.
+
+A trace file is a header followed by one block per game, written as each
+game ends, so a batch run can stream traces of any number of games. All
+integers are little-endian:
+
+    file header  magic b"MSTR", version                              "<4sH"
+    game header  height, width, mines, first move i, j, result,
+                 flags, seed, move count, board class name length     "<HHIHHBBQIB"
+                 (flags: bit 0 the seed is set, bit 1 opening board)
+                 board class name (ASCII)
+    mine bitmap  height * width bits, row-major, least significant bit first
+    moves        one per revealed cell chosen by the AI:
+                 i, j, deciding stage, cells revealed,
+                 smart_move seconds, mine probability (NaN if unknown) "<HHBIfe"
+
+The first move of a game has stage "first". A game is replayed either from
+its seed, which regenerates the board and the AI's random choices exactly,
+or from the mine bitmap alone.
+"""
+import collections
+import math
+import struct
+
+MAGIC = b"MSTR"
+VERSION = 2
+FILE_HEADER = struct.Struct("<4sH")
+GAME_HEADER = struct.Struct("<HHIHHBBQIB")
+MOVE = struct.Struct("<HHBIfe")
+
+RESULTS = ("won", "lost", "stuck")
+STAGES = ("first", "safe", "csp", "partial_overlap", "sat", "endgame", "overlap", "exact",
+          "bayesian", "mcmc", "monte_carlo", "estimate")
+# Stage codes by trace version; version 1 traces still have the pattern stage
+VERSION_STAGES = {
+    1: ("first", "safe", "pattern", "csp", "partial_overlap", "sat", "endgame", "overlap",
+        "exact", "bayesian", "mcmc", "monte_carlo", "estimate"),
+    VERSION: STAGES,
+}
+UNKNOWN_STAGE = 255
+HAS_SEED = 1
+OPENING = 2
+
+TraceMove = collections.namedtuple("TraceMove", "cell stage revealed seconds probability")
+
+
+class GameTrace:
+    """
+    One game: the board, how it was generated and every move played.
+    """
+    def __init__(self, height, width, mines, first_move, mine_cells, seed=None,
+                 board_class="Minesweeper", opening=False):
+        self.height = height
+        self.width = width
+        self.mines = mines
+        self.first_move = first_move
+        self.mine_cells = set(mine_cells)
+        self.seed = seed
+        self.board_class = board_class
+        self.opening = opening
+        self.moves = []
+        self.result = None
+
+    def add_move(self, cell, stage, revealed, seconds=0.0, probability=None):
+        self.moves.append(TraceMove(cell, stage, revealed, seconds, probability))
+
+    def seconds(self):
+        return sum(move.seconds for move in self.moves)
+
+    def slowest(self):
+        return max(self.moves, key=lambda move: move.seconds, default=None)
+
+    def to_bytes(self):
+        name = self.board_class.encode("ascii")
+        seed = self.seed if self.seed is not None else 0
+        flags = (HAS_SEED if self.seed is not None else 0) | (OPENING if self.opening else 0)
+        parts = [GAME_HEADER.pack(self.height, self.width, self.mines, self.first_move[0],
+                                  self.first_move[1], RESULTS.index(self.result),
+                                  flags, seed, len(self.moves), len(name)),
+                 name]
+        bitmap = bytearray((self.height * self.width + 7) // 8)
+        for i, j in self.mine_cells:
+            index = i * self.width + j
+            bitmap[index >> 3] |= 1 << (index & 7)
+        parts.append(bytes(bitmap))
+        for cell, stage, revealed, seconds, probability in self.moves:
+            code = STAGES.index(stage) if stage in STAGES else UNKNOWN_STAGE
+            parts.append(MOVE.pack(cell[0], cell[1], code, revealed, seconds,
+                                   math.nan if probability is None else probability))
+        return b"".join(parts)
+
+
+class TraceWriter:
+    """
+    Streams game traces to a binary file object.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.games = 0
+        stream.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, game):
+        self.stream.write(game.to_bytes())
+        self.games += 1
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("truncated trace")
+    return data
+
+
+def read_traces(stream):
+    """
+    Yield the GameTrace of every game in a binary trace stream.
+    """
+    magic, version = FILE_HEADER.unpack(_read_exactly(stream, FILE_HEADER.size))
+    stages = VERSION_STAGES.get(version)
+    if magic != MAGIC or stages is None:
+        raise ValueError(f"not a version {' or '.join(map(str, VERSION_STAGES))} trace")
+    while True:
+        header = stream.read(GAME_HEADER.size)
+        if not header:
+            return
+        if len(header) != GAME_HEADER.size:
+            raise ValueError("truncated trace")
+        (height, width, mines, first_i, first_j, result, flags, seed, moves,
+         name_length) = GAME_HEADER.unpack(header)
+        board_class = _read_exactly(stream, name_length).decode("ascii")
+        bitmap = _read_exactly(stream, (height * width + 7) // 8)
+        mine_cells = {divmod(index * 8 + bit, width)
+                      for index, byte in enumerate(bitmap) if byte
+                      for bit in range(8) if byte >> bit & 1}
+        game = GameTrace(height, width, mines, (first_i, first_j), mine_cells,
+                         seed if flags & HAS_SEED else None, board_class, bool(flags & OPENING))
+        game.result = RESULTS[result]
+        data = _read_exactly(stream, MOVE.size * moves)
+        for i, j, code, revealed, seconds, probability in MOVE.iter_unpack(data):
+            stage = stages[code] if code < len(stages) else None
+            game.add_move((i, j), stage, revealed, seconds,
+                          None if math.isnan(probability) else probability)
+        yield game
@@ -0,0 +1,49 @@
+"""
+Instrumentation hooks for MinesweeperAI.smart_move.
+
+An instrument is any object with two methods, assigned to
+MinesweeperAI.instrument:
+
+    stage(name, seconds)   called after every smart_move stage runs
+    move(record)           called once per smart_move with a move record
+
+A move record is a JSON-serialisable dict:
+
+    move          [i, j] of the chosen cell, or None
+    stage         stage that produced the move (None if none did)
+    seconds       wall time of the whole smart_move call
+    stages        {stage: seconds} for the stages that ran
+    knowledge     number of sentences in the knowledge base
+    mines         number of known mines
+    safes         number of known safe cells not yet revealed
+    mc_acceptance [accepted, drawn] if Monte Carlo sampling ran
+    mcmc          MCMC diagnostics if the MCMC stage ran
+    cache         [hits, misses] of the component cache during this move
+    probability   mine probability of the chosen cell, if known
+    deadline      time budget of the move in seconds, or None
+    truncated     True if the deadline cut the move short, so the decision
+                  rests on skipped stages or a partial estimate
+
+With no instrument set, smart_move does no timing and builds no records.
+"""
+
+
+class StageTotals:
+    """
+    Accumulates wall time and call counts per stage, and the number of
+    moves each stage decided.
+    """
+    def __init__(self):
+        self.stage_times = {}
+        self.stage_calls = {}
+        self.stage_moves = {}
+
+    def stage(self, name, seconds):
+        self.stage_times[name] = self.stage_times.get(name, 0.0) + seconds
+        self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def move(self, record):
+        stage = record["stage"]
+        if stage is not None:
+            self.stage_moves[stage] = self.stage_moves.get(stage, 0) + 1
+
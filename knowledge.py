@@ -0,0 +1,363 @@
+"""
+Indexed knowledge base for the Minesweeper AI.
+
+Sentences are stored by id with an inverted index from each cell to the
+sentences that mention it, so marking a cell as a mine or safe only
+touches the sentences containing it. Every sentence that changes is put
+on a dirty work queue, and propagation only re-examines those sentences
+instead of rescanning the whole knowledge base until nothing changes.
+The same index restricts pairwise inference to sentences that overlap.
+
+A sentence is stored as a bitmask of its cells (see bitset.py) and its
+count, with no set of cells of its own, so the pairwise set algebra runs
+as integer bit operations and popcounts and a sentence takes a small
+fraction of the memory of a set of cell tuples. Masks are relative to the
+sentence's lowest cell number, which keeps them a few board rows long
+however large the board is and makes every set of cells encode one way.
+
+The knowledge base stays small by construction. A sentence is canonical
+once its known cells are removed, so two sentences over the same cells
+are duplicates; insert rejects them, and rejects a sentence implied by
+two others (S = A + B for disjoint sentences A and B) or drops the
+sentences a new one makes implied in the same way. Sentences derived by
+inference rather than read off a revealed cell are marked as derived;
+evict drops the oldest of them to hold the size under a cap. A sentence
+that takes the place of one read off a revealed cell stops being derived,
+so eviction loses no information the revealed cells still give.
+
+While journal is a list, every change appends an undo entry to it, a
+tuple (function, *args) that reverses the change when called. Undoing the
+entries in reverse order restores the knowledge base exactly, at a cost
+proportional to the changes made rather than to its size (see
+MinesweeperAI.checkpoint).
+"""
+import collections
+
+from bitset import cell_index, cells_to_mask, mask_to_cells
+
+
+class MaskSentence:
+    """
+    Sentence "count of the cells are mines" with the cells as a bitmask
+    relative to offset, the number of its lowest cell.
+    """
+    __slots__ = ("mask", "offset", "count")
+
+    def __init__(self, mask, offset, count):
+        self.mask = mask
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+
+def _normalise(mask, offset):
+    # Shift the lowest set bit to bit 0, so equal cell sets have equal masks
+    if mask and not mask & 1:
+        low = (mask & -mask).bit_length() - 1
+        return mask >> low, offset + low
+    return mask, offset
+
+
+def _encode(cells, width):
+    offset = min((cell_index(cell, width) for cell in cells), default=0)
+    return cells_to_mask(cells, width, offset), offset
+
+
+class KnowledgeBase:
+    """
+    Collection of MaskSentence sentences with a cell -> sentence index.
+    Iterating yields (cells, count) pairs, so code that unpacks
+    `for cells, count in knowledge` keeps working. width is the board
+    width used to number cells in the bitmasks.
+    """
+    def __init__(self, width):
+        self.width = width
+        self.sentences = {}
+        self.index = {}
+        self.dirty = set()
+        self.next_id = 0
+        self.journal = None
+        # Ids of the derived sentences, oldest first, so evict finds the
+        # oldest at once; unordered is set when undo puts an old id last
+        self.derived = collections.OrderedDict()
+        self.unordered = False
+        # Sentences seen at most at once, and sentences rejected or removed
+        # as duplicates, as implied by others, to respect the size cap and
+        # as contradicting the others
+        self.peak = 0
+        self.duplicates = 0
+        self.subsumed = 0
+        self.evicted = 0
+        self.contradictions = 0
+
+    def __iter__(self):
+        return iter([(self.cells(sentence_id), sentence.count)
+                     for sentence_id, sentence in self.sentences.items()])
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def cells(self, sentence_id):
+        """
+        Set of the cells of a sentence.
+        """
+        sentence = self.sentences[sentence_id]
+        return set(mask_to_cells(sentence.mask, self.width, sentence.offset))
+
+    def add(self, cells, count, derived=False):
+        """
+        Add the sentence "count of cells are mines" and queue it for
+        propagation. Returns the new sentence id.
+        """
+        sentence_id = self.next_id
+        self.next_id += 1
+        self.sentences[sentence_id] = MaskSentence(*_encode(cells, self.width), count)
+        for cell in cells:
+            self.index.setdefault(cell, set()).add(sentence_id)
+        self.dirty.add(sentence_id)
+        if derived:
+            self._derive(sentence_id)
+        self.peak = max(self.peak, len(self.sentences))
+        if self.journal is not None:
+            self.journal.append((self._unadd, sentence_id))
+        return sentence_id
+
+    def insert(self, cells, count, derived=False):
+        """
+        Add a sentence over a non-empty set of cells unless it duplicates a
+        sentence or is implied by two, and remove the sentences it makes
+        implied. A duplicate with another count is counted as a
+        contradiction. Returns the new sentence id, or None if it was
+        rejected.
+        """
+        mask, offset = _encode(cells, self.width)
+        duplicate = self._lookup(mask, offset)
+        if duplicate is not None:
+            if self.sentences[duplicate].count != count:
+                self.contradictions += 1
+            elif not derived:
+                self._keep(duplicate)
+            self.duplicates += 1
+            return None
+        implied = self._implied(cells, mask, offset, count)
+        if implied:
+            if not derived:
+                self._keep(*implied)
+            self.subsumed += 1
+            return None
+        sentence_id = self.add(cells, count, derived)
+        self._prune_supersets(sentence_id, cells)
+        return sentence_id
+
+    def _rest(self, mask, offset, part):
+        # Id and count of the sentence over the cells of mask not in part,
+        # a sentence whose cells are a proper subset of them, or None
+        if part.offset < offset:
+            return None
+        aligned = part.mask << (part.offset - offset)
+        if aligned & ~mask or aligned == mask:
+            return None
+        rest = self._lookup(*_normalise(mask & ~aligned, offset))
+        return None if rest is None else (rest, self.sentences[rest].count)
+
+    def _implied(self, cells, mask, offset, count):
+        # cells = other + rest for sentences other and rest with matching
+        # counts; returns their ids, or None
+        ids = {i for cell in cells for i in self.index.get(cell, ())}
+        for other_id in ids:
+            other = self.sentences[other_id]
+            rest = self._rest(mask, offset, other)
+            if rest is not None and rest[1] == count - other.count:
+                return other_id, rest[0]
+        return None
+
+    def _keep(self, *ids):
+        # Sentences standing in for one read off a revealed cell are no
+        # longer derived, so evict never drops them
+        for sentence_id in ids:
+            if sentence_id in self.derived:
+                del self.derived[sentence_id]
+                if self.journal is not None:
+                    self.journal.append((self._derive, sentence_id))
+
+    def _derive(self, sentence_id):
+        if self.derived and sentence_id < next(reversed(self.derived)):
+            self.unordered = True
+        self.derived[sentence_id] = None
+
+    def _prune_supersets(self, sentence_id, cells):
+        # Remove every S = new + rest with rest a sentence of the right count
+        sentence = self.sentences[sentence_id]
+        ids = None
+        for cell in cells:
+            ids = set(self.index[cell]) if ids is None else ids & self.index[cell]
+        for other_id in ids:
+            other = self.sentences[other_id]
+            rest = self._rest(other.mask, other.offset, sentence)
+            if rest is not None and rest[1] == other.count - sentence.count:
+                if other_id not in self.derived:
+                    self._keep(sentence_id, rest[0])
+                self.remove(other_id)
+                self.subsumed += 1
+
+    def remove_duplicate(self, sentence_id):
+        """
+        Remove a sentence whose cells became those of another sentence,
+        counting a contradiction if their counts differ. Returns True if it
+        was removed.
+        """
+        sentence = self.sentences[sentence_id]
+        duplicate = None
+        if sentence.mask:
+            duplicate = self._lookup(sentence.mask, sentence.offset, sentence_id)
+        if duplicate is not None:
+            if self.sentences[duplicate].count != sentence.count:
+                self.contradictions += 1
+            elif sentence_id not in self.derived:
+                self._keep(duplicate)
+            self.remove(sentence_id)
+            self.duplicates += 1
+            return True
+        return False
+
+    def evict(self, limit):
+        """
+        Remove the oldest derived sentences until at most limit are left
+        or none of them is.
+        """
+        if self.unordered:
+            self.derived = collections.OrderedDict.fromkeys(sorted(self.derived))
+            self.unordered = False
+        while len(self.sentences) > limit and self.derived:
+            self.remove(next(iter(self.derived)))
+            self.evicted += 1
+
+    def stats(self):
+        return {
+            "size": len(self.sentences),
+            "peak": self.peak,
+            "duplicates": self.duplicates,
+            "subsumed": self.subsumed,
+            "evicted": self.evicted,
+            "contradictions": self.contradictions,
+        }
+
+    def _unadd(self, sentence_id):
+        self.remove(sentence_id)
+        self.next_id = sentence_id
+
+    def remove(self, sentence_id):
+        sentence = self.sentences.pop(sentence_id)
+        if self.journal is not None:
+            self.journal.append((self._restore, sentence_id, sentence,
+                                 sentence_id in self.dirty, sentence_id in self.derived))
+        for cell in mask_to_cells(sentence.mask, self.width, sentence.offset):
+            ids = self.index.get(cell)
+            if ids is not None:
+                ids.discard(sentence_id)
+                if not ids:
+                    del self.index[cell]
+        self.dirty.discard(sentence_id)
+        self.derived.pop(sentence_id, None)
+
+    def _restore(self, sentence_id, sentence, dirty, derived):
+        self.sentences[sentence_id] = sentence
+        for cell in mask_to_cells(sentence.mask, self.width, sentence.offset):
+            self.index.setdefault(cell, set()).add(sentence_id)
+        if dirty:
+            self.dirty.add(sentence_id)
+        if derived:
+            self._derive(sentence_id)
+
+    def _lookup(self, mask, offset, exclude=None):
+        # Id of a sentence other than exclude with this normalised mask
+        for sentence_id in self.index.get(divmod(offset, self.width), ()):
+            sentence = self.sentences[sentence_id]
+            if sentence_id != exclude and sentence.mask == mask and sentence.offset == offset:
+                return sentence_id
+        return None
+
+    def overlapping_pairs(self):
+        """
+        Yield (offset, (mask, count), (mask, count)) for every pair of
+        sentences that share at least one cell, once, using the cell index
+        instead of comparing all pairs. Both masks are relative to offset.
+        """
+        for sentence_id, sentence in list(self.sentences.items()):
+            neighbors = set()
+            for cell in mask_to_cells(sentence.mask, self.width, sentence.offset):
+                neighbors.update(self.index.get(cell, ()))
+            for other_id in neighbors:
+                if other_id > sentence_id:
+                    other = self.sentences[other_id]
+                    mask = sentence.mask
+                    other_mask = other.mask
+                    offset = sentence.offset
+                    shift = other.offset - offset
+                    if shift >= 0:
+                        other_mask <<= shift
+                    else:
+                        mask <<= -shift
+                        offset += shift
+                    yield offset, (mask, sentence.count), (other_mask, other.count)
+
+    def mask_sentences(self):
+        """
+        List of (mask, count) for every sentence, with board-wide masks.
+        """
+        return [(sentence.mask << sentence.offset, sentence.count)
+                for sentence in self.sentences.values()]
+
+    def containing(self, cell):
+        """
+        Ids of the sentences that mention cell.
+        """
+        return self.index.get(cell, ())
+
+    def resolve(self, cell, is_mine):
+        """
+        Remove a cell whose state is now known from every sentence that
+        mentions it, decrementing the counts if it is a mine.
+        """
+        ids = self.index.pop(cell, ())
+        if self.journal is not None and ids:
+            self.journal.append((self._unresolve, cell, is_mine, ids, ids - self.dirty))
+        number = cell_index(cell, self.width)
+        for sentence_id in ids:
+            sentence = self.sentences[sentence_id]
+            sentence.mask, sentence.offset = _normalise(
+                sentence.mask & ~(1 << (number - sentence.offset)), sentence.offset)
+            if is_mine:
+                sentence.count -= 1
+            self.dirty.add(sentence_id)
+
+    def _unresolve(self, cell, is_mine, ids, clean):
+        self.index[cell] = ids
+        number = cell_index(cell, self.width)
+        for sentence_id in ids:
+            sentence = self.sentences[sentence_id]
+            if not sentence.mask:
+                sentence.mask, sentence.offset = 1, number
+            elif number < sentence.offset:
+                sentence.mask = sentence.mask << (sentence.offset - number) | 1
+                sentence.offset = number
+            else:
+                sentence.mask |= 1 << (number - sentence.offset)
+            if is_mine:
+                sentence.count += 1
+        self.dirty -= clean
+
+    def pop_dirty(self):
+        """
+        Return the id and MaskSentence of a changed sentence still in the
+        knowledge base, or None when the work queue is empty.
+        """
+        while self.dirty:
+            sentence_id = self.dirty.pop()
+            if self.journal is not None:
+                self.journal.append((self.dirty.add, sentence_id))
+            if sentence_id in self.sentences:
+                return sentence_id, self.sentences[sentence_id]
+        return None
@@ -0,0 +1,94 @@
+"""
+Board layout of the runner.py window, kept free of pygame so it can be
+checked headless.
+
+Cells shrink until the board fits its area of the window, down to
+MIN_CELL_SIZE pixels. A board that still does not fit is shown through a
+viewport of the rows and columns that do, which scroll() moves. Rectangles
+are (x, y, width, height) tuples in window pixels.
+"""
+
+# Smallest cell drawn; larger boards are shown through a viewport
+MIN_CELL_SIZE = 1
+
+
+class BoardLayout:
+    """
+    Maps the cells of a rows x cols board to rectangles of the board area
+    (x, y, width, height) and back.
+    """
+    def __init__(self, rows, cols, area, min_cell_size=MIN_CELL_SIZE):
+        self.rows = rows
+        self.cols = cols
+        self.x, self.y, width, height = area
+        self.cell_size = max(min_cell_size, int(min(width / cols, height / rows)))
+        self.visible_rows = max(1, min(rows, int(height // self.cell_size)))
+        self.visible_cols = max(1, min(cols, int(width // self.cell_size)))
+        self.top = 0
+        self.left = 0
+
+    def scroll(self, rows, cols):
+        """
+        Move the viewport by rows and cols, stopping at the board's edges.
+        Returns True if it moved.
+        """
+        top = min(max(self.top + rows, 0), self.rows - self.visible_rows)
+        left = min(max(self.left + cols, 0), self.cols - self.visible_cols)
+        moved = (top, left) != (self.top, self.left)
+        self.top, self.left = top, left
+        return moved
+
+    def visible(self, cell):
+        i, j = cell
+        return (self.top <= i < self.top + self.visible_rows
+                and self.left <= j < self.left + self.visible_cols)
+
+    def visible_cells(self):
+        for i in range(self.top, self.top + self.visible_rows):
+            for j in range(self.left, self.left + self.visible_cols):
+                yield (i, j)
+
+    def cell_rect(self, cell):
+        """
+        Rectangle of a visible cell.
+        """
+        i, j = cell
+        return (self.x + (j - self.left) * self.cell_size,
+                self.y + (i - self.top) * self.cell_size,
+                self.cell_size, self.cell_size)
+
+    def cell_at(self, position):
+        """
+        Visible cell at a window position, or None.
+        """
+        j = (position[0] - self.x) // self.cell_size
+        i = (position[1] - self.y) // self.cell_size
+        if 0 <= i < self.visible_rows and 0 <= j < self.visible_cols:
+            return (int(i) + self.top, int(j) + self.left)
+        return None
+
+    def regions(self, cells, limit):
+        """
+        Group the visible cells among cells into at most limit rectangles
+        to update: square tiles of the viewport, doubled in size until few
+        enough of them hold a cell. Returns a list of (rectangle, cells).
+        """
+        visible = [cell for cell in cells if self.visible(cell)]
+        tile = 1
+        while True:
+            tiles = {}
+            for i, j in visible:
+                key = ((i - self.top) // tile, (j - self.left) // tile)
+                tiles.setdefault(key, []).append((i, j))
+            if len(tiles) <= limit or tile >= max(self.visible_rows, self.visible_cols):
+                break
+            tile *= 2
+        return [(self._tile_rect(row, col, tile), members)
+                for (row, col), members in tiles.items()]
+
+    def _tile_rect(self, row, col, tile):
+        # A tile clipped to the viewport
+        rows = min(tile, self.visible_rows - row * tile)
+        cols = min(tile, self.visible_cols - col * tile)
+        return (self.x + col * tile * self.cell_size, self.y + row * tile * self.cell_size,
+                cols * self.cell_size, rows * self.cell_size)
@@ -0,0 +1,304 @@
+"""
+Constraint-aware Markov chain Monte Carlo for large frontiers.
+
+When a frontier component is too large to enumerate, mine probabilities
+are estimated with a Markov chain over assignments of the frontier cells
+(the cells mentioned by some sentence). Cells outside the frontier are
+exchangeable, so only how many of them are mines matters: an assignment
+with k frontier mines has weight comb(F, mines_left - k) for the F
+unconstrained cells, which keeps the remaining mine total exact.
+
+Each chain starts from a consistent assignment found by randomized
+depth-first search and then runs block Gibbs updates: a random connected
+block of frontier cells is unassigned and redrawn from all of its
+completions that keep every sentence satisfied, weighted by the number of
+ways to place the remaining mines. Every state the chain visits is
+therefore consistent with the knowledge and the mine total, with no
+rejected proposals. Several chains are run so convergence can be checked
+with the Gelman-Rubin statistic.
+"""
+import time
+
+
+def _r_hat(tallies, sizes):
+    """
+    Largest Gelman-Rubin potential scale reduction over the frontier cells,
+    from per-chain mine tallies and sample counts.
+    """
+    if len(sizes) < 2 or min(sizes) < 2:
+        return float("inf")
+    n = min(sizes)
+    worst = 1.0
+    for cell in range(len(tallies[0])):
+        means = [tally[cell] / size for tally, size in zip(tallies, sizes)]
+        within = sum(p * (1 - p) * size / (size - 1) for p, size in zip(means, sizes)) / len(sizes)
+        grand = sum(means) / len(means)
+        between = n * sum((p - grand) ** 2 for p in means) / (len(means) - 1)
+        if within == 0:
+            if between > 0:
+                return float("inf")
+            continue
+        pooled = (n - 1) / n * within + between / n
+        worst = max(worst, (pooled / within) ** 0.5)
+    return worst
+
+
+def _weight_ratio(free, rest, new_rest):
+    """
+    comb(free, new_rest) / comb(free, rest), the change in the number of
+    ways to place the remaining mines among the free cells.
+    """
+    if not 0 <= new_rest <= free:
+        return 0.0
+    ratio = 1.0
+    while rest < new_rest:
+        ratio *= (free - rest) / (rest + 1)
+        rest += 1
+    while rest > new_rest:
+        ratio *= rest / (free - rest + 1)
+        rest -= 1
+    return ratio
+
+
+def _initial_state(sentences, cell_sentences, mines_left, free, rng, max_nodes=100000):
+    """
+    Find one assignment satisfying every sentence and the mine total by
+    randomized depth-first search, or None if none is found in max_nodes.
+    The search keeps its own stack, so frontiers of any size fit.
+    """
+    size = len(cell_sentences)
+    remaining = [count for _, count in sentences]
+    unassigned = [len(cells) for cells, _ in sentences]
+    state = [False] * size
+    # Values still to try for each cell on the search path, in random order
+    untried = []
+    mines = 0
+    nodes = 0
+    cell = 0
+    while True:
+        nodes += 1
+        if nodes > max_nodes:
+            return None
+        if cell < size:
+            untried.append(rng.sample((True, False), 2))
+            backtrack = False
+        elif 0 <= mines_left - mines <= free:
+            return state
+        elif not size:
+            return None
+        else:
+            cell -= 1
+            backtrack = True
+        # Give cell its next value that keeps every sentence satisfiable,
+        # going back to earlier cells while no value is left
+        while True:
+            links = cell_sentences[cell]
+            if backtrack:
+                mine = state[cell]
+                for s in links:
+                    remaining[s] += mine
+                    unassigned[s] += 1
+                mines -= mine
+                state[cell] = False
+            options = untried[cell]
+            while options:
+                mine = options.pop(0)
+                for s in links:
+                    remaining[s] -= mine
+                    unassigned[s] -= 1
+                if mines + mine <= mines_left and all(0 <= remaining[s] <= unassigned[s] for s in links):
+                    break
+                for s in links:
+                    remaining[s] += mine
+                    unassigned[s] += 1
+            else:
+                untried.pop()
+                if not cell:
+                    return None
+                cell -= 1
+                backtrack = True
+                continue
+            state[cell] = mine
+            mines += mine
+            cell += 1
+            break
+
+
+class _Chain:
+    """
+    One block Gibbs chain over consistent frontier assignments.
+    """
+    def __init__(self, sentences, cell_sentences, neighbors, mines_left, free, state,
+                 block_size, rng):
+        self.sentences = sentences
+        self.cell_sentences = cell_sentences
+        self.neighbors = neighbors
+        self.mines_left = mines_left
+        self.free = free
+        self.block_size = block_size
+        self.rng = rng
+        self.state = list(state)
+        self.mines = sum(self.state)
+        self.changed = 0
+
+    def _block(self):
+        # Random connected block grown breadth-first from a random cell
+        start = self.rng.randrange(len(self.state))
+        block = [start]
+        seen = {start}
+        for cell in block:
+            others = [other for other in self.neighbors[cell] if other not in seen]
+            self.rng.shuffle(others)
+            for other in others[:self.block_size - len(block)]:
+                seen.add(other)
+                block.append(other)
+            if len(block) >= self.block_size:
+                break
+        return block
+
+    def step(self):
+        """
+        Redraw a random block from its consistent completions.
+        """
+        block = self._block()
+        members = set(block)
+        touched = {s for cell in block for s in self.cell_sentences[cell]}
+        remaining = {}
+        unassigned = {}
+        for s in touched:
+            cells, target = self.sentences[s]
+            fixed = sum(self.state[cell] for cell in cells if cell not in members)
+            remaining[s] = target - fixed
+            unassigned[s] = sum(1 for cell in cells if cell in members)
+        old_mines = sum(self.state[cell] for cell in block)
+        outside = self.mines - old_mines
+        rest = self.mines_left - self.mines
+        solutions = []
+        weights = []
+        assignment = [False] * len(block)
+
+        def backtrack(position, mines):
+            if position == len(block):
+                weight = _weight_ratio(self.free, rest, self.mines_left - outside - mines)
+                if weight:
+                    solutions.append((tuple(assignment), mines))
+                    weights.append(weight)
+                return
+            links = self.cell_sentences[block[position]]
+            for mine in (True, False):
+                for s in links:
+                    remaining[s] -= mine
+                    unassigned[s] -= 1
+                if all(0 <= remaining[s] <= unassigned[s] for s in links):
+                    assignment[position] = mine
+                    backtrack(position + 1, mines + mine)
+                for s in links:
+                    remaining[s] += mine
+                    unassigned[s] += 1
+            assignment[position] = False
+
+        backtrack(0, 0)
+        if not solutions:
+            return
+        values, mines = self.rng.choices(solutions, weights)[0]
+        for cell, value in zip(block, values):
+            if self.state[cell] != value:
+                self.state[cell] = value
+                self.changed += 1
+        self.mines = outside + mines
+
+
+def mcmc_probabilities(knowledge, candidates, mines_left, rng, chains=4, steps=4000,
+                       burn_in=None, thin=1, block_size=12, time_budget=None):
+    """
+    Estimate the probability that each candidate cell is a mine.
+    steps is the total number of block updates shared by the chains, the
+    first burn_in updates of each chain (default a quarter) are discarded
+    and every thin-th later state is recorded. Stops early after
+    time_budget seconds. rng is a random.Random.
+    Returns (probabilities, diagnostics); probabilities is None when no
+    consistent assignment was found.
+    """
+    start = time.perf_counter()
+    position = {cell: i for i, cell in enumerate(candidates)}
+    frontier_cells = []
+    frontier_index = {}
+    sentences = []
+    for cells, count in knowledge:
+        indices = []
+        for cell in cells:
+            if cell not in position:
+                continue
+            if cell not in frontier_index:
+                frontier_index[cell] = len(frontier_cells)
+                frontier_cells.append(cell)
+            indices.append(frontier_index[cell])
+        sentences.append((indices, count))
+    cell_sentences = [[] for _ in frontier_cells]
+    for sentence, (cells, _) in enumerate(sentences):
+        for cell in cells:
+            cell_sentences[cell].append(sentence)
+    free = len(candidates) - len(frontier_cells)
+    diagnostics = {"chains": chains, "steps": 0, "samples": 0, "changed": 0.0,
+                   "r_hat": float("inf"), "truncated": False}
+    if not frontier_cells:
+        if not 0 <= mines_left <= len(candidates) or not candidates:
+            return None, diagnostics
+        p = mines_left / len(candidates)
+        diagnostics["r_hat"] = 1.0
+        return {cell: p for cell in candidates}, diagnostics
+
+    neighbors = []
+    for cell, links in enumerate(cell_sentences):
+        near = {other for sentence in links for other in sentences[sentence][0]}
+        near.discard(cell)
+        neighbors.append(sorted(near))
+    runs = []
+    for _ in range(chains):
+        state = _initial_state(sentences, cell_sentences, mines_left, free, rng)
+        if state is None:
+            return None, diagnostics
+        runs.append(_Chain(sentences, cell_sentences, neighbors, mines_left, free, state,
+                           block_size, rng))
+
+    per_chain = max(1, steps // chains)
+    burn_in = per_chain // 4 if burn_in is None else burn_in
+    tallies = [[0] * len(frontier_cells) for _ in runs]
+    free_mines = [0] * chains
+    sizes = [0] * chains
+    for step in range(per_chain):
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            diagnostics["truncated"] = True
+            break
+        for index, chain in enumerate(runs):
+            chain.step()
+            if step >= burn_in and (step - burn_in) % thin == 0:
+                tally = tallies[index]
+                for cell, mine in enumerate(chain.state):
+                    if mine:
+                        tally[cell] += 1
+                free_mines[index] += mines_left - chain.mines
+                sizes[index] += 1
+        diagnostics["steps"] += chains
+
+    samples = sum(sizes)
+    diagnostics["samples"] = samples
+    diagnostics["changed"] = sum(chain.changed for chain in runs) / max(1, diagnostics["steps"])
+    if not samples:
+        # Out of time during burn-in: fall back to the current states
+        for index, chain in enumerate(runs):
+            tallies[index] = [int(mine) for mine in chain.state]
+            free_mines[index] = mines_left - chain.mines
+            sizes[index] = 1
+        samples = chains
+    else:
+        diagnostics["r_hat"] = _r_hat(tallies, sizes)
+    probabilities = {}
+    for cell, index in frontier_index.items():
+        probabilities[cell] = sum(tally[index] for tally in tallies) / samples
+    if free:
+        p = sum(free_mines) / samples / free
+        for cell in candidates:
+            if cell not in frontier_index:
+                probabilities[cell] = p
+    return probabilities, diagnostics
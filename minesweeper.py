@@ -1,27 +1,55 @@
-import itertools
+import collections
 import random
+import time
+
+from bitset import cell_bit, mask_to_cells
+from knowledge import KnowledgeBase
+from mcmc import mcmc_probabilities
+from probability import (MAX_COMPONENT_CELLS, ComponentCache, belief_propagation,
+                         exact_probabilities)
+
+def excluded_cells(height, width, safe_cell, opening=False):
+    """
+    Cells that must not hold a mine: the safe first cell and, for a zero
+    opening, its neighbours too.
+    """
+    if safe_cell is None:
+        return set()
+    if not opening:
+        return {safe_cell}
+    i, j = safe_cell
+    return {(a, b) for a in range(i - 1, i + 2) for b in range(j - 1, j + 2)
+            if 0 <= a < height and 0 <= b < width}
+
 
 class Minesweeper:
     """
     Minesweeper game representation
     """
-    def __init__(self, height=8, width=8, mines=5, safe_cell=(3, 3)):
+    def __init__(self, height=8, width=8, mines=5, safe_cell=(3, 3), rng=None, opening=False):
         self.height = height
         self.width = width
         self.totalMines = mines
         self.safe_cell = safe_cell
+        # Per-game random.Random so boards are reproducible from a seed
+        self.rng = rng if rng is not None else random.Random()
+        # With opening the first click also has no nearby mines, so it opens a region
+        excluded = excluded_cells(height, width, safe_cell, opening)
+        if mines > height * width - len(excluded):
+            raise ValueError(f"{mines} mines do not fit on a {height}x{width} board")
         self.mines = set()
         self.board = []
         for i in range(self.height):
             row = [False] * self.width
             self.board.append(row)
         while len(self.mines) < self.totalMines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if (i, j) != self.safe_cell and not self.board[i][j]:
+            i = self.rng.randrange(height)
+            j = self.rng.randrange(width)
+            if (i, j) not in excluded and not self.board[i][j]:
                 self.mines.add((i, j))
                 self.board[i][j] = True
         self.mines_found = set()
+        self.revealed = set()
 
     def print(self):
         for i in range(self.height):
@@ -46,10 +74,96 @@ class Minesweeper:
                         count += 1
         return count
 
+    def reveal(self, cell):
+        """
+        Reveal a safe cell and, breadth-first, every cell around each
+        revealed cell with no nearby mines. Returns the newly revealed
+        (cell, nearby mines) pairs, or None if cell is a mine.
+        """
+        if self.is_mine(cell):
+            return None
+        if cell in self.revealed:
+            return []
+        self.revealed.add(cell)
+        queue = collections.deque([cell])
+        result = []
+        while queue:
+            current = queue.popleft()
+            count = self.nearby_mines(current)
+            result.append((current, count))
+            if count:
+                continue
+            for i in range(current[0] - 1, current[0] + 2):
+                for j in range(current[1] - 1, current[1] + 2):
+                    if 0 <= i < self.height and 0 <= j < self.width and (i, j) not in self.revealed:
+                        self.revealed.add((i, j))
+                        queue.append((i, j))
+        return result
+
     def won(self):
         return self.mines_found == self.mines
 
 
+class RandomSet:
+    """
+    Set with O(1) add, discard and uniform random choice: items are kept in
+    a list with their positions, and a discarded item is swapped with the
+    last one.
+    """
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        """
+        Remove item if present. Returns its position, or None.
+        """
+        position = self.positions.pop(item, None)
+        if position is None:
+            return None
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+        return position
+
+    def restore(self, item, position):
+        """
+        Undo the discard of item from position, so the order of the items,
+        and with it every later choice, is as before.
+        """
+        if position < len(self.items):
+            moved = self.items[position]
+            self.positions[moved] = len(self.items)
+            self.items.append(moved)
+            self.items[position] = item
+        else:
+            self.items.append(item)
+        self.positions[item] = position
+
+    def choice(self, rng):
+        return rng.choice(self.items)
+
+    def copy(self):
+        return RandomSet(self.items)
+
+
 class Sentence:
     """
     Logical statement about a Minesweeper game
@@ -88,285 +202,690 @@ class Sentence:
 
 
 class MinesweeperAI:
-    def __init__(self, height, width, mines):
+    # Stages that still run after the smart_move deadline has passed
+    UNTIMED_STAGES = ("safe", "endgame", "estimate")
+    # Belief propagation sweeps estimate_move runs when no engine estimated
+    ESTIMATE_ITERATIONS = 3
+
+    def __init__(self, height, width, mines, rng=None):
         self.height = height
         self.width = width
         self.movesMade = set()
         self.mines = set()
         self.totalMines = mines
         self.safeMoves = set()
-        self.knowledge = []
+        self.knowledge = KnowledgeBase(width)
+        # Most sentences kept; derived ones are evicted above it (None for
+        # no cap)
+        self.max_sentences = None
+        # Kept up to date by add_knowledge, mark_mine and mark_safe so no
+        # stage has to scan the whole board: cells neither revealed nor
+        # known mines, and known safe cells not yet revealed
+        self.unrevealed = {(i, j) for i in range(height) for j in range(width)}
+        self.pending_safes = RandomSet()
+        # Per-game random.Random used for guesses and tie-breaking
+        self.rng = rng if rng is not None else random.Random()
+        # Monte Carlo budget: sample count, optional seconds, NumPy batches
+        self.simulations = 10000
+        self.simulation_time = None
+        self.batched_sampling = False
+        # (accepted, drawn) samples of the last Monte Carlo search
+        self.mc_acceptance = None
+        # Block Gibbs MCMC budget for frontiers too large to enumerate
+        self.mcmc_steps = 2000
+        self.mcmc_time = None
+        # Diagnostics of the last MCMC search
+        self.mcmc_diagnostics = None
+        # Largest frontier component exact_search will enumerate
+        self.max_component_cells = MAX_COMPONENT_CELLS
+        # Enumerated components reused across moves (None to disable)
+        self.component_cache = ComponentCache()
+        # Optional complete inference backend (sat.CardinalitySolver), run
+        # after the pairwise rules when set
+        self.sat_solver = None
+        # Default smart_move time budget in seconds (None for no limit)
+        self.move_deadline = None
+        # perf_counter time the current move must be decided by, whether
+        # the move was cut short by it, and the latest probability estimate
+        self.deadline = None
+        self.truncated = False
+        self._estimate = None
+        # Stage that produced the last smart_move result
+        self.last_stage = None
+        # Optional instrument (see instrumentation.py) receiving stage timings
+        # and one record per smart_move
+        self.instrument = None
+        self._move_stages = None
+        # Undo log of the changes since the oldest open checkpoint, shared
+        # with the knowledge base, and the log length at each checkpoint
+        self._undo = None
+        self._checkpoints = []
+
+    def checkpoint(self):
+        """
+        Start recording changes to the game state (the known cells and the
+        knowledge base) so rollback can undo them. Checkpoints nest.
+        Returns the checkpoint to pass to rollback or release.
+        """
+        if self._undo is None:
+            self._undo = []
+            self.knowledge.journal = self._undo
+        self._checkpoints.append(len(self._undo))
+        return len(self._checkpoints) - 1
+
+    def rollback(self, checkpoint=None):
+        """
+        Undo every change made since checkpoint (the latest one by default)
+        and close it and the checkpoints opened after it. Takes time
+        proportional to the changes undone, not to the size of the state.
+        The random number generator and per-move statistics are not
+        restored.
+        """
+        if checkpoint is None:
+            checkpoint = len(self._checkpoints) - 1
+        size = self._checkpoints[checkpoint]
+        undo = self._undo
+        # Undoing must not log new entries
+        self.knowledge.journal = None
+        while len(undo) > size:
+            entry = undo.pop()
+            entry[0](*entry[1:])
+        self.knowledge.journal = undo
+        self.release(checkpoint)
+
+    def release(self, checkpoint=None):
+        """
+        Close checkpoint (the latest one by default) and the checkpoints
+        opened after it, keeping the changes made since.
+        """
+        if checkpoint is None:
+            checkpoint = len(self._checkpoints) - 1
+        del self._checkpoints[checkpoint:]
+        if not self._checkpoints:
+            self._undo = None
+            self.knowledge.journal = None
+
+    def _add(self, cells, cell):
+        if self._undo is not None and cell not in cells:
+            self._undo.append((cells.discard, cell))
+        cells.add(cell)
+
+    def _discard(self, cells, cell):
+        if self._undo is not None and cell in cells:
+            self._undo.append((cells.add, cell))
+        cells.discard(cell)
+
+    def _discard_pending(self, cell):
+        position = self.pending_safes.discard(cell)
+        if self._undo is not None and position is not None:
+            self._undo.append((self.pending_safes.restore, cell, position))
+
+    def forced_after(self, cell, count):
+        """
+        Number of cells the pairwise rules would mark safe or mine if cell
+        were revealed showing count nearby mines. The hypothetical reveal
+        is undone before returning, so guesses can be compared by the
+        information each outcome gives.
+        """
+        checkpoint = self.checkpoint()
+        try:
+            known = len(self.safeMoves) + len(self.mines) + (cell not in self.safeMoves)
+            self.add_knowledge(cell, count)
+            while self.pair_inference():
+                pass
+            return len(self.safeMoves) + len(self.mines) - known
+        finally:
+            self.rollback(checkpoint)
 
     def mark_mine(self, cell):
-        self.mines.add(cell)
-        # Update all sentences to reflect the new mine
-        for sentence in self.knowledge:
-            if cell in sentence[0]:
-                sentence[0].discard(cell)
-                sentence[1] -= 1
+        self._add(self.mines, cell)
+        self._discard(self.unrevealed, cell)
+        # Update only the sentences that mention the new mine
+        self.knowledge.resolve(cell, True)
 
     def mark_safe(self, cell):
-        self.safeMoves.add(cell)
-        # Update all sentences to reflect the new safe cell
-        for sentence in self.knowledge:
-            sentence[0].discard(cell)
+        self._add(self.safeMoves, cell)
+        if cell not in self.movesMade:
+            self._add(self.pending_safes, cell)
+        # Update only the sentences that mention the new safe cell
+        self.knowledge.resolve(cell, False)
 
     def add_knowledge(self, cell, count):
-        self.movesMade.add(cell)
+        self._add(self.movesMade, cell)
+        self._discard(self.unrevealed, cell)
+        self._discard_pending(cell)
         self.mark_safe(cell)
         new_sentence = {(i, j) for i in range(cell[0] - 1, cell[0] + 2)
                         for j in range(cell[1] - 1, cell[1] + 2)
                         if 0 <= i < self.height and 0 <= j < self.width
                         and (i, j) not in self.movesMade}
-        if new_sentence:
-            self.knowledge.append([new_sentence, count])
+        self.add_sentence(new_sentence, count)
         self.update_knowledge()
 
+    def add_knowledge_batch(self, revealed):
+        """
+        Add several revealed (cell, count) pairs, such as the result of
+        Minesweeper.reveal, and propagate once for all of them.
+        """
+        for cell, _ in revealed:
+            self._add(self.movesMade, cell)
+            self._discard(self.unrevealed, cell)
+            self._discard_pending(cell)
+            self.mark_safe(cell)
+        for cell, count in revealed:
+            new_sentence = {(i, j) for i in range(cell[0] - 1, cell[0] + 2)
+                            for j in range(cell[1] - 1, cell[1] + 2)
+                            if 0 <= i < self.height and 0 <= j < self.width
+                            and (i, j) not in self.movesMade}
+            self.add_sentence(new_sentence, count)
+        self.update_knowledge()
+
+    def add_sentence(self, cells, count, derived=False):
+        """
+        Add a sentence to the knowledge base, dropping cells already known
+        to be mines or safe. derived marks sentences inferred from others,
+        which may be evicted to respect max_sentences. Returns False if it
+        is empty, a duplicate, implied by other sentences or impossible.
+        """
+        known_mines = cells & self.mines
+        cells = cells - known_mines - self.safeMoves
+        count -= len(known_mines)
+        if not 0 <= count <= len(cells):
+            self.knowledge.contradictions += 1
+            return False
+        if not cells or self.knowledge.insert(cells, count, derived) is None:
+            return False
+        if self.max_sentences is not None:
+            self.knowledge.evict(self.max_sentences)
+        return True
+
     def update_knowledge(self):
-        updated = True
-        while updated:
-            updated = False
-            for sentence in self.knowledge[:]:
-                cells, count = sentence
-                known_mines = cells & self.mines
-                known_safes = cells & self.safeMoves
-                cells = cells - known_mines - known_safes
-                count -= len(known_mines)
-                if count < 0 or count > len(cells):
-                    self.knowledge.remove(sentence)
-                    updated = True
-                    continue
-                if not cells:
-                    self.knowledge.remove(sentence)
-                    updated = True
-                    continue
-                # Collect cells to mark instead of modifying during iteration
-                if len(cells) == count and count > 0:
-                    cells_to_mark = set(cells)  # Copy to avoid iteration issues
-                    self.knowledge.remove(sentence)
-                    updated = True
-                    for cell in cells_to_mark:
-                        self.mark_mine(cell)
-                elif count == 0 and cells:
-                    cells_to_mark = set(cells)  # Copy to avoid iteration issues
-                    self.knowledge.remove(sentence)
-                    updated = True
-                    for cell in cells_to_mark:
-                        self.mark_safe(cell)
-                else:
-                    # Update the sentence only if no immediate action was taken
-                    sentence[0] = cells
-                    sentence[1] = count
+        """
+        Propagate changed sentences until no sentence yields a new mine or
+        safe cell. Marking a cell queues the sentences containing it.
+        """
+        while True:
+            item = self.knowledge.pop_dirty()
+            if item is None:
+                break
+            sentence_id, sentence = item
+            size = len(sentence)
+            count = sentence.count
+            if count < 0 or count > size:
+                # Only possible if the revealed counts contradict each other
+                self.knowledge.contradictions += 1
+                self.knowledge.remove(sentence_id)
+                continue
+            if not size:
+                self.knowledge.remove(sentence_id)
+                continue
+            # Resolving cells can make two sentences identical
+            if self.knowledge.remove_duplicate(sentence_id):
+                continue
+            # Mark cells in row-major order: the order they are marked in
+            # decides which safe cell a later random choice picks
+            if size == count:
+                cells_to_mark = mask_to_cells(sentence.mask, self.width, sentence.offset)
+                self.knowledge.remove(sentence_id)
+                for cell in cells_to_mark:
+                    self.mark_mine(cell)
+            elif count == 0:
+                cells_to_mark = mask_to_cells(sentence.mask, self.width, sentence.offset)
+                self.knowledge.remove(sentence_id)
+                for cell in cells_to_mark:
+                    self.mark_safe(cell)
 
     def get_unrevealed(self):
-        return [(i, j) for i in range(self.height) for j in range(self.width)
-                if (i, j) not in self.movesMade and (i, j) not in self.mines]
+        return sorted(self.unrevealed)
+
+    def frontier(self):
+        """
+        Unknown cells mentioned by at least one sentence.
+        """
+        return self.knowledge.index.keys()
+
+    def neighbors(self, cell):
+        return [(i, j) for i in range(cell[0] - 1, cell[0] + 2)
+                for j in range(cell[1] - 1, cell[1] + 2)
+                if (i, j) != cell and 0 <= i < self.height and 0 <= j < self.width]
 
     def make_safe_move(self):
-        safe_choices = self.safeMoves - self.movesMade
-        return random.choice(tuple(safe_choices)) if safe_choices else None
+        safe_choices = self.pending_safes
+        return safe_choices.choice(self.rng) if safe_choices else None
 
     def csp_move(self):
+        self.pair_inference()
+        available_safes = self.pending_safes
+        return available_safes.choice(self.rng) if available_safes else None
+
+    def pair_inference(self):
+        """
+        One combined pass over every pair of sentences that share a cell.
+        With O the shared cells and A, B the cells only in the first or
+        second sentence, the mines in O are bounded by both counts; that
+        bounds the mines in A and B, which may make A or B all safe or all
+        mines, or give exact new sentences. A subset is the case A = {}.
+        Returns True when a new mine, safe cell or sentence was found.
+        """
         safes = set()
         mines = set()
-        for cells, count in self.knowledge:
-            if count == 0:
-                safes.update(cells)
-            elif len(cells) == count:
-                mines.update(cells)
-        for s1, c1 in self.knowledge:
-            for s2, c2 in self.knowledge:
-                if s1 == s2:
+        new_sentences = {}
+        for offset, (s1, c1), (s2, c2) in self.knowledge.overlapping_pairs():
+            overlap = s1 & s2
+            s1_only = s1 & ~s2
+            s2_only = s2 & ~s1
+            low = max(0, c1 - s1_only.bit_count(), c2 - s2_only.bit_count())
+            high = min(overlap.bit_count(), c1, c2)
+            if low > high:
+                continue
+            for cells, count in ((s1_only, c1), (s2_only, c2)):
+                if not cells:
                     continue
-                if s1.issubset(s2):
-                    new_cells = s2 - s1
-                    new_count = c2 - c1
-                    if new_count == 0:
-                        safes.update(new_cells)
-                    elif len(new_cells) == new_count:
-                        mines.update(new_cells)
+                if count - low == 0:
+                    safes.update(mask_to_cells(cells, self.width, offset))
+                elif count - high == cells.bit_count():
+                    mines.update(mask_to_cells(cells, self.width, offset))
+                elif low == high:
+                    new_sentences[frozenset(mask_to_cells(cells, self.width, offset))] = count - low
+            if low == high and overlap != s1 and overlap != s2:
+                new_sentences[frozenset(mask_to_cells(overlap, self.width, offset))] = low
         newly_safe = safes - self.movesMade - self.safeMoves
-        newly_mine = mines - self.movesMade - self.mines
+        newly_mine = mines - self.movesMade - self.mines - newly_safe
         for cell in newly_safe:
             self.mark_safe(cell)
         for cell in newly_mine:
             self.mark_mine(cell)
+        added = 0
+        for cells, count in new_sentences.items():
+            added += self.add_sentence(set(cells), count, derived=True)
         self.update_knowledge()
-        available_safes = self.safeMoves - self.movesMade
-        return random.choice(tuple(available_safes)) if available_safes else None
+        return bool(newly_safe or newly_mine or added)
+
+    def sat_inference(self):
+        """
+        Ask the cardinality solver which frontier cells every consistent
+        assignment agrees on. This finds the deductions that need three or
+        more sentences, which the pairwise rules miss. Returns True when a
+        new mine or safe cell was found.
+        """
+        if self.sat_solver is None:
+            return False
+        safes, mines = self.sat_solver.forced(self.knowledge)
+        for cell in safes:
+            self.mark_safe(cell)
+        for cell in mines:
+            self.mark_mine(cell)
+        if safes or mines:
+            self.update_knowledge()
+        return bool(safes or mines)
 
     def partial_overlap_inference(self):
         """
-        Analyze pairs of sentences with partial overlap to create new sentences
-        for non-overlapping cells, which may lead to new safe or mine inferences.
+        Analyze pairs of sentences with partial overlap again, now that the
+        sentences derived by csp_move can overlap the others, which may lead
+        to new safe or mine inferences.
         """
-        new_sentences = []
-        for (s1, c1), (s2, c2) in itertools.combinations(self.knowledge, 2):
-            if s1 == s2 or not (s1 & s2):
-                continue
-            overlap = s1 & s2
-            s1_only = s1 - s2
-            s2_only = s2 - s1
-            new_cells = s1_only | s2_only
-            new_count = c1 + c2 - 2 * len(overlap)
-            if new_count >= 0 and new_cells:
-                new_sentences.append([new_cells, new_count])
-        for cells, count in new_sentences:
-            if count == 0:
-                for cell in cells:
-                    self.mark_safe(cell)
-            elif len(cells) == count:
-                for cell in cells:
-                    self.mark_mine(cell)
-            else:
-                self.knowledge.append([cells, count])
-        self.update_knowledge()
+        self.pair_inference()
 
     def infer_overlap_mines(self):
-        new_mines = set()
-        for s1, c1 in self.knowledge:
-            for s2, c2 in self.knowledge:
-                if s1 == s2:
-                    continue
-                if s1.issubset(s2):
-                    diff_cells = s2 - s1
-                    diff_count = c2 - c1
-                    if diff_count == len(diff_cells):
-                        new_mines.update(diff_cells)
-        for cell in new_mines:
-            self.mark_mine(cell)
-        if new_mines:
-            print(f"Inferred mines from overlap logic: {new_mines}")
+        """
+        Infer mines from subset and overlap reasoning over sentence pairs.
+        """
+        self.pair_inference()
 
     def overlapping_mine(self):
-        unrevealed = self.get_unrevealed()
-        for cell in unrevealed:
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    if dx == 0 and dy == 0:
-                        continue
-                    ni, nj = cell[0] + dx, cell[1] + dy
-                    neighbor = (ni, nj)
-                    if 0 <= ni < self.height and 0 <= nj < self.width:
-                        if neighbor in self.mines:
-                            for sentence, count in self.knowledge:
-                                if neighbor in sentence and count == 1:
-                                    return cell
+        """
+        Return an unrevealed neighbour of a known mine that still appears in
+        a sentence with count 1. Such mines can only be frontier cells, so
+        only the frontier is searched.
+        """
+        for mine in [cell for cell in self.frontier() if cell in self.mines]:
+            if any(self.knowledge.sentences[i].count == 1 for i in self.knowledge.containing(mine)):
+                for cell in self.neighbors(mine):
+                    if cell in self.unrevealed:
+                        return cell
         return None
 
     def bayesian_inference(self, unrevealed):
-        if not unrevealed:
+        """
+        Pick the cell least likely to be a mine from loopy belief
+        propagation marginals over the sentences. Returns None when belief
+        propagation does not converge or every cell is likely a mine.
+        """
+        candidates = [cell for cell in unrevealed if cell not in self.pending_safes]
+        if not candidates:
             return None
         totalMines_left = self.totalMines - len(self.mines)
-        prior = totalMines_left / len(unrevealed)
-        cell_probs = {cell: prior for cell in unrevealed}
-        for sentence, count in self.knowledge:
-            if not sentence:
-                continue
-            unknown_cells = sentence - self.mines - self.safeMoves
-            if not unknown_cells:
-                continue
-            likelihood = count / len(unknown_cells)
-            for cell in unknown_cells:
-                cell_probs[cell] = (cell_probs[cell] + likelihood) / 2
+        cell_probs, converged = belief_propagation(self.knowledge, candidates, totalMines_left,
+                                                   deadline=self.deadline)
+        self._estimate = cell_probs
+        if not converged:
+            if self._expired():
+                self.truncated = True
+            return None
         safest_cell = min(cell_probs, key=lambda cell: cell_probs[cell])
-        if cell_probs[safest_cell] >= 0.8 or len(unrevealed) == 63:
+        if cell_probs[safest_cell] >= 0.8:
             return None
         return safest_cell
 
-    def monte_carlo_search(self, unrevealed, simulations=10000):
+    def monte_carlo_search(self, unrevealed, simulations=None):
+        """
+        Sample mine placements consistent with the knowledge base and pick
+        the cell that was safe most often. Stops after simulations samples
+        (default self.simulations) or self.simulation_time seconds. With
+        self.batched_sampling, samples are drawn in NumPy batches.
+        """
         if not unrevealed:
             return None
+        simulations = self.simulations if simulations is None else simulations
+        budget = self._time_budget(self.simulation_time)
+        deadline = None
+        if budget is not None:
+            deadline = time.perf_counter() + budget
         move_scores = {cell: 0 for cell in unrevealed}
         mines_left = self.totalMines - len(self.mines)
         known_mines = set(self.mines)
-        known_safes = set(self.safeMoves    )
+        known_safes = self.pending_safes
         candidates = [cell for cell in unrevealed if cell not in known_mines and cell not in known_safes]
         if not candidates:
             return None
+        for safe in known_safes:
+            if safe in move_scores:
+                return safe
+        if self.batched_sampling:
+            return self._batched_monte_carlo(candidates, mines_left, simulations)
+        # Sentences never contain known mines, so only sampled mines are checked
+        candidate_bits = [cell_bit(cell, self.width) for cell in candidates]
+        constraints = self.knowledge.mask_sentences()
+        accepted = 0
+        drawn = 0
         for _ in range(simulations):
+            if deadline is not None and drawn % 256 == 0 and time.perf_counter() >= deadline:
+                break
+            drawn += 1
             try:
-                simulated_mines = set(random.sample(candidates, mines_left))
+                sample = self.rng.sample(candidate_bits, mines_left)
             except ValueError:
                 continue
-            simulated_mines.update(known_mines)
-            consistent = True
-            for sentence, count in self.knowledge:
-                mines_in_cells = len([cell for cell in sentence if cell in simulated_mines])
-                if mines_in_cells != count:
-                    consistent = False
-                    break
-            if not consistent:
+            simulated_mines = 0
+            for bit in sample:
+                simulated_mines |= bit
+            if any((mask & simulated_mines).bit_count() != count for mask, count in constraints):
                 continue
+            accepted += 1
+            simulated_mines = set(mask_to_cells(simulated_mines, self.width))
             for cell in unrevealed:
                 if cell not in simulated_mines:
                     move_scores[cell] += 1
-        for safe in known_safes:
-            if safe in move_scores:
-                return safe
+        self.mc_acceptance = (accepted, drawn)
+        if drawn < simulations and self._expired():
+            self.truncated = True
         if all(score == 0 for score in move_scores.values()):
-            return random.choice(candidates)
+            return self.rng.choice(candidates)
         safest_cell = max(move_scores, key=lambda cell: move_scores[cell])
         return safest_cell
 
-    def smart_move(self):
+    def _batched_monte_carlo(self, candidates, mines_left, simulations):
+        import numpy as np
+        from sampling import sample_mine_counts
+        generator = np.random.default_rng(self.rng.getrandbits(64))
+        mine_counts, accepted, drawn = sample_mine_counts(
+            self.knowledge, candidates, mines_left, generator, simulations,
+            time_budget=self._time_budget(self.simulation_time))
+        self.mc_acceptance = (accepted, drawn)
+        if drawn < simulations and self._expired():
+            self.truncated = True
+        if not accepted:
+            return self.rng.choice(candidates)
+        return candidates[int(np.argmin(mine_counts))]
+
+    def exact_search(self, unrevealed):
+        """
+        Pick the cell least likely to be a mine using exact frontier
+        enumeration, marking any cell found to be a certain mine or safe.
+        Returns None if a frontier component is too large to enumerate.
+        """
+        candidates = [cell for cell in unrevealed if cell not in self.safeMoves]
+        if not candidates:
+            return None
+        mines_left = self.totalMines - len(self.mines)
+        probabilities = exact_probabilities(self.knowledge, candidates, mines_left,
+                                            self.max_component_cells,
+                                            cache=self.component_cache,
+                                            deadline=self.deadline)
+        if probabilities is None:
+            if self._expired():
+                self.truncated = True
+            return None
+        self._estimate = probabilities
+        safes = [cell for cell, p in probabilities.items() if p == 0]
+        mines = [cell for cell, p in probabilities.items() if p == 1]
+        for cell in safes:
+            self.mark_safe(cell)
+        for cell in mines:
+            self.mark_mine(cell)
+        if safes or mines:
+            self.update_knowledge()
+        if safes:
+            return self.make_safe_move()
+        lowest = min(probabilities.values())
+        return self.rng.choice([cell for cell, p in probabilities.items() if p == lowest])
+
+    def mcmc_search(self, unrevealed):
+        """
+        Pick the cell least likely to be a mine from block Gibbs MCMC
+        estimates, for frontiers too large for exact_search. The run is
+        bounded by mcmc_steps and mcmc_time; convergence diagnostics are
+        kept in mcmc_diagnostics. Returns None if no consistent
+        configuration is found.
+        """
+        candidates = [cell for cell in unrevealed if cell not in self.safeMoves]
+        if not candidates:
+            return None
+        mines_left = self.totalMines - len(self.mines)
+        probabilities, self.mcmc_diagnostics = mcmc_probabilities(
+            self.knowledge, candidates, mines_left, self.rng, steps=self.mcmc_steps,
+            time_budget=self._time_budget(self.mcmc_time))
+        if probabilities is None:
+            return None
+        if self.mcmc_diagnostics["truncated"] and self._expired():
+            self.truncated = True
+        self._estimate = probabilities
+        lowest = min(probabilities.values())
+        return self.rng.choice([cell for cell, p in probabilities.items() if p == lowest])
+
+    def smart_move(self, deadline=None):
         """
         AI Agent:
         Logical moves
             1. Safe moves - propositional logic
             2. CSP-based logical inference
             3. Partial overlap inference
+            4. Cardinality solver inference, if sat_solver is set
         If no unrevealed cells or unrevealed cells + mines = total mines, return None
-            4. Overlapping mine - Infer more mines using overlap neighbors and return safe
+            5. Overlapping mine - Infer more mines using overlap neighbors and return safe
         If no unrevealed cells or unrevealed cells + mines = total mines, return None
         Probabilistic moves when no logical move exists
-            1. Bayesian inference, return None when probability is high
-            2. Monte Carlo search, return cell after 10000 simulations
+            1. Exact frontier enumeration, return the cell least likely to be a mine
+        When the frontier is too large to enumerate
+            2. Bayesian inference (belief propagation), return None when it does not converge
+            3. Block Gibbs MCMC estimates
+            4. Monte Carlo search if MCMC finds no consistent configuration
+        deadline is the number of seconds the move may take (default
+        self.move_deadline). Stages still to run once it has passed are
+        skipped and the probability engines return their estimate so far;
+        truncated is then True and the move is the safest cell of the
+        latest estimate.
         """
+        deadline = self.move_deadline if deadline is None else deadline
+        self.deadline = None if deadline is None else time.perf_counter() + deadline
+        self.truncated = False
+        self._estimate = None
+        if self.instrument is None:
+            return self._smart_move()
+        self._move_stages = {}
+        self.mc_acceptance = None
+        self.mcmc_diagnostics = None
+        cache = self.component_cache
+        hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        start = time.perf_counter()
+        move = self._smart_move()
+        self.instrument.move({
+            "move": list(move) if move else None,
+            "stage": self.last_stage,
+            "seconds": time.perf_counter() - start,
+            "stages": self._move_stages,
+            "knowledge": len(self.knowledge),
+            "mines": len(self.mines),
+            "safes": len(self.pending_safes),
+            "mc_acceptance": list(self.mc_acceptance) if self.mc_acceptance else None,
+            "mcmc": self.mcmc_diagnostics,
+            "cache": [cache.hits - hits, cache.misses - misses] if cache is not None else None,
+            "probability": self.probability(move) if move else None,
+            "deadline": deadline,
+            "truncated": self.truncated,
+        })
+        return move
+
+    def _smart_move(self):
         #Try a known safe move
-        move = self.make_safe_move()
+        move = self._run_stage("safe", self.make_safe_move)
         if move:
             return move
 
         #Try CSP logical inference
-        move = self.csp_move()
+        move = self._run_stage("csp", self.csp_move)
         if move:
             return move
 
         #Try partial overlap inference
-        self.partial_overlap_inference()
-        move = self.make_safe_move()
+        self._run_stage("partial_overlap", self.partial_overlap_inference)
+        move = self._run_stage("partial_overlap", self.make_safe_move)
         if move:
             return move
 
+        #Try complete inference with the cardinality solver
+        if self.sat_solver is not None:
+            self._run_stage("sat", self.sat_inference)
+            move = self._run_stage("sat", self.make_safe_move)
+            if move:
+                return move
+
         #Check unrevealed cells
-        unrevealed = self.get_unrevealed()
-        if not unrevealed or len(unrevealed) + len(self.mines) == self.totalMines:
-            for cell in unrevealed:
-                self.mark_mine(cell)
+        if self._run_stage("endgame", self.endgame):
             return None
 
         # Try to infer mines and find low-risk nearby move
-        self.infer_overlap_mines()
-        move = self.overlapping_mine()
+        self._run_stage("overlap", self.infer_overlap_mines)
+        move = self._run_stage("overlap", self.overlapping_mine)
         if move:
             return move
 
         #Check unrevealed cells again
-        unrevealed = self.get_unrevealed()
-        if not unrevealed or len(unrevealed) + len(self.mines) == self.totalMines:
-            for cell in unrevealed:
-                self.mark_mine(cell)
+        if self._run_stage("endgame", self.endgame):
             return None
 
-        #Use Bayesian inference
-        move = self.bayesian_inference(unrevealed)
+        #Use exact frontier enumeration
+        unrevealed = self.get_unrevealed()
+        move = self._run_stage("exact", self.exact_search, unrevealed)
+        if move:
+            return move
+
+        #Use Bayesian inference (belief propagation) for large frontiers
+        move = self._run_stage("bayesian", self.bayesian_inference, unrevealed)
+        if move:
+            return move
+
+        #Use MCMC estimates for large frontiers
+        move = self._run_stage("mcmc", self.mcmc_search, unrevealed)
         if move:
             return move
 
         #Use Monte Carlo search
-        move = self.monte_carlo_search(unrevealed)
+        move = self._run_stage("monte_carlo", self.monte_carlo_search, unrevealed)
         if move:
             return move
 
-        return None
\ No newline at end of file
+        #Out of time: fall back on the latest estimate
+        if self.truncated:
+            return self._run_stage("estimate", self.estimate_move, unrevealed)
+
+        self.last_stage = None
+        return None
+
+    def estimate_move(self, unrevealed):
+        """
+        Best guess once the deadline has passed: the cell least likely to be
+        a mine in the latest probability estimate. When the deadline cut
+        every engine short before it made one, the estimate comes from
+        ESTIMATE_ITERATIONS untimed belief propagation sweeps, which cost
+        time linear in the sentence cells.
+        """
+        candidates = [cell for cell in unrevealed if cell not in self.pending_safes]
+        if not candidates:
+            return None
+        if not self._estimate:
+            self._estimate, _ = belief_propagation(self.knowledge, candidates,
+                                                   self.totalMines - len(self.mines),
+                                                   iterations=self.ESTIMATE_ITERATIONS)
+        if self._estimate:
+            estimated = [cell for cell in candidates if cell in self._estimate]
+            if estimated:
+                return min(estimated, key=self._estimate.get)
+        return self.rng.choice(candidates)
+
+    def probability(self, cell):
+        """
+        Probability that cell is a mine according to the current move: 0
+        for a known safe cell, else the latest estimate, or None if the move
+        made none.
+        """
+        if cell in self.safeMoves:
+            return 0.0
+        if self._estimate and cell in self._estimate:
+            return self._estimate[cell]
+        return None
+
+    def _expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def _time_budget(self, limit):
+        """
+        Seconds a stage may use: limit capped by the time left to the
+        deadline. None means no limit.
+        """
+        if self.deadline is None:
+            return limit
+        left = max(0.0, self.deadline - time.perf_counter())
+        return left if limit is None else min(limit, left)
+
+    def endgame(self):
+        """
+        Mark every unrevealed cell as a mine once only mines can be left.
+        Returns True when the game has no moves left to make.
+        """
+        if not self.unrevealed or len(self.unrevealed) + len(self.mines) == self.totalMines:
+            for cell in list(self.unrevealed):
+                self.mark_mine(cell)
+            return True
+        return False
+
+    def _run_stage(self, stage, method, *args):
+        """
+        Call one smart_move stage, remembering it as the deciding stage and
+        reporting its wall time to the instrument, if any. Once the deadline
+        has passed only the untimed stages run.
+        """
+        self.last_stage = stage
+        if stage not in self.UNTIMED_STAGES and self._expired():
+            self.truncated = True
+            return None
+        if self.instrument is None:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._move_stages[stage] = self._move_stages.get(stage, 0.0) + elapsed
+            self.instrument.stage(stage, elapsed)
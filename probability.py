@@ -0,0 +1,406 @@
+"""
+Mine probabilities: exact frontier enumeration and belief propagation.
+
+The knowledge base is split into independent components of sentences that
+share cells. The consistent mine assignments of each component are
+enumerated by backtracking and tallied by the number of mines they use.
+Components are then combined with the global number of remaining mines:
+a total of K frontier mines is weighted by comb(F, mines_left - K), the
+number of ways to place the other mines among the F unconstrained cells.
+All counting is done with exact integers.
+
+For frontiers too large to enumerate, belief_propagation gives approximate
+marginals by loopy belief propagation over the same sentences.
+"""
+import collections
+import math
+import time
+
+# Components with more cells than this are not enumerated
+MAX_COMPONENT_CELLS = 40
+
+
+class ComponentCache:
+    """
+    LRU cache of enumerated components. A component is keyed by its
+    sentences normalised as a frozenset of (frozenset(cells), count), so
+    between moves only the components touched by new knowledge have to be
+    enumerated again.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(sentences):
+        return frozenset((frozenset(cells), count) for cells, count in sentences)
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def frontier_components(knowledge):
+    """
+    Split sentences into independent components. Two sentences are in the
+    same component when they are linked by a chain of shared cells.
+    Returns a list of lists of (cells, count) pairs.
+    """
+    parent = {}
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    sentences = [(cells, count) for cells, count in knowledge if cells]
+    for cells, _ in sentences:
+        for cell in cells:
+            parent.setdefault(cell, cell)
+        root = find(next(iter(cells)))
+        for cell in cells:
+            other = find(cell)
+            if other != root:
+                parent[other] = root
+
+    components = {}
+    for cells, count in sentences:
+        components.setdefault(find(next(iter(cells))), []).append((cells, count))
+    return list(components.values())
+
+
+class _Timeout(Exception):
+    pass
+
+
+class InconsistentKnowledge(Exception):
+    """
+    No mine assignment satisfies the sentences and the number of mines
+    left.
+    """
+
+
+def enumerate_component(sentences, max_cells=MAX_COMPONENT_CELLS, deadline=None):
+    """
+    Enumerate the mine assignments of a component that satisfy every
+    sentence. Returns (cells, solutions, cell_mines) where solutions[k] is
+    the number of assignments with k mines and cell_mines[k][i] is how many
+    of those have a mine on cells[i], or None if the component has more
+    than max_cells cells or time.perf_counter() passes deadline.
+    """
+    # Order cells breadth-first through the sentences so constraints close early
+    cell_sentences = {}
+    for index, (cells, _) in enumerate(sentences):
+        for cell in cells:
+            cell_sentences.setdefault(cell, []).append(index)
+    if max_cells is not None and len(cell_sentences) > max_cells:
+        return None
+    order = []
+    seen = set()
+    for cells, _ in sentences:
+        for cell in sorted(cells):
+            if cell not in seen:
+                seen.add(cell)
+                order.append(cell)
+    links = [cell_sentences[cell] for cell in order]
+    remaining = [count for _, count in sentences]
+    unassigned = [len(cells) for cells, _ in sentences]
+    assignment = [False] * len(order)
+    solutions = {}
+    cell_mines = {}
+    nodes = 0
+
+    def backtrack(position, mines):
+        nonlocal nodes
+        nodes += 1
+        if deadline is not None and nodes % 1024 == 0 and time.perf_counter() >= deadline:
+            raise _Timeout
+        if position == len(order):
+            solutions[mines] = solutions.get(mines, 0) + 1
+            tally = cell_mines.setdefault(mines, [0] * len(order))
+            for i, is_mine in enumerate(assignment):
+                if is_mine:
+                    tally[i] += 1
+            return
+        sentence_ids = links[position]
+        # Try the cell as a mine
+        for s in sentence_ids:
+            remaining[s] -= 1
+            unassigned[s] -= 1
+        if all(remaining[s] >= 0 for s in sentence_ids):
+            assignment[position] = True
+            backtrack(position + 1, mines + 1)
+            assignment[position] = False
+        # Try the cell as safe
+        for s in sentence_ids:
+            remaining[s] += 1
+        if all(remaining[s] <= unassigned[s] for s in sentence_ids):
+            backtrack(position + 1, mines)
+        for s in sentence_ids:
+            unassigned[s] += 1
+
+    try:
+        backtrack(0, 0)
+    except _Timeout:
+        return None
+    return order, solutions, cell_mines
+
+
+def _rest_weights(free, rests):
+    """
+    {rest: weight} proportional to comb(free, rest) for each of rests
+    between 0 and free. The weights share one factor, which cancels out of
+    every probability, so they stay exact integers whose size grows with
+    the spread of rests instead of with free.
+    """
+    rests = [rest for rest in rests if 0 <= rest <= free]
+    if not rests:
+        return {}
+    low, high = min(rests), max(rests)
+    # comb(free, r + 1) / comb(free, r) = (free - r) / (r + 1); scaling by
+    # the product of the denominators keeps every weight an integer
+    weight = math.prod(range(low + 1, high + 1))
+    weights = {low: weight}
+    for rest in range(low, high):
+        weight = weight // (rest + 1) * (free - rest)
+        weights[rest + 1] = weight
+    return weights
+
+
+def _convolve(a, b):
+    result = {}
+    for i, x in a.items():
+        for j, y in b.items():
+            result[i + j] = result.get(i + j, 0) + x * y
+    return result
+
+
+def _clamp(numerator, denominator):
+    """
+    numerator / denominator as a float that is 0 or 1 only when exact.
+    """
+    p = numerator / denominator
+    if p == 0.0 and numerator:
+        return math.nextafter(0.0, 1.0)
+    if p == 1.0 and numerator != denominator:
+        return math.nextafter(1.0, 0.0)
+    return p
+
+
+def solve_components(knowledge, max_cells=MAX_COMPONENT_CELLS, cache=None, deadline=None):
+    """
+    Enumerate every independent component of knowledge, reusing cached
+    results from cache (a ComponentCache) when given. Returns the list of
+    enumerate_component results, or None if a component is too large or
+    the deadline passes.
+    """
+    components = []
+    for sentences in frontier_components(knowledge):
+        key = None
+        result = None
+        if cache is not None:
+            key = ComponentCache.key(sentences)
+            result = cache.get(key)
+        if result is not None:
+            components.append(result)
+            continue
+        result = enumerate_component(sentences, max_cells, deadline)
+        if result is None:
+            return None
+        if cache is not None:
+            cache.put(key, result)
+        components.append(result)
+    return components
+
+
+def exact_probabilities(knowledge, unknown, mines_left, max_cells=MAX_COMPONENT_CELLS,
+                        components=None, cache=None, deadline=None, strict=False):
+    """
+    Exact probability that each unknown cell is a mine, given the sentences
+    in knowledge (whose cells must all be unknown) and the number of mines
+    left. Returns {cell: probability}, or None when a component is larger
+    than max_cells, the knowledge is inconsistent or time.perf_counter()
+    passes deadline. With strict, inconsistent knowledge raises
+    InconsistentKnowledge instead. components may hold already enumerated
+    components (the output of enumerate_component); otherwise they are
+    enumerated, through cache if given.
+    """
+    if components is None:
+        components = solve_components(knowledge, max_cells, cache, deadline)
+        if components is None:
+            return None
+    frontier = set()
+    for cells, solutions, _ in components:
+        if not solutions:
+            if strict:
+                raise InconsistentKnowledge
+            return None
+        frontier.update(cells)
+    others = [cell for cell in unknown if cell not in frontier]
+    free = len(others)
+
+    # prefix[i] / suffix[i] are the mine-count distributions of components before / after i
+    prefix = [{0: 1}]
+    for _, solutions, _ in components:
+        prefix.append(_convolve(prefix[-1], solutions))
+    suffix = [{0: 1}]
+    for _, solutions, _ in reversed(components):
+        suffix.append(_convolve(suffix[-1], solutions))
+    suffix.reverse()
+    total = prefix[-1]
+    weights = _rest_weights(free, [mines_left - k for k in total])
+
+    def weight(frontier_mines):
+        return weights.get(mines_left - frontier_mines, 0)
+
+    normaliser = sum(ways * weight(k) for k, ways in total.items())
+    if not normaliser:
+        if strict:
+            raise InconsistentKnowledge
+        return None
+
+    probabilities = {}
+    for index, (cells, solutions, cell_mines) in enumerate(components):
+        rest = _convolve(prefix[index], suffix[index + 1])
+        for k, tally in cell_mines.items():
+            factor = sum(ways * weight(k + other) for other, ways in rest.items())
+            for i, cell in enumerate(cells):
+                probabilities[cell] = probabilities.get(cell, 0) + tally[i] * factor
+        for cell in cells:
+            probabilities[cell] = _clamp(probabilities.get(cell, 0), normaliser)
+    if others:
+        # Ways to place the remaining mines with a given unconstrained cell
+        # mined: comb(free - 1, rest - 1) = comb(free, rest) * rest / free
+        mined = sum(ways * weight(k) * (mines_left - k) for k, ways in total.items())
+        p = _clamp(mined, normaliser * free)
+        for cell in others:
+            probabilities[cell] = p
+    return probabilities
+
+
+def _add_cell(distribution, q):
+    """
+    Mine-count distribution after adding a cell that is a mine with
+    probability q.
+    """
+    result = [x * (1 - q) for x in distribution] + [0.0]
+    for k, x in enumerate(distribution):
+        result[k + 1] += x * q
+    return result
+
+
+def _factor_messages(incoming, count):
+    """
+    Sum-product messages from a sentence to each of its cells: for cell i,
+    the probability that the other cells hold count - 1 mines against
+    count mines, with prefix and suffix distributions of the other cells.
+    """
+    n = len(incoming)
+    prefix = [[1.0]]
+    for q in incoming:
+        prefix.append(_add_cell(prefix[-1], q))
+    suffix = [[1.0]]
+    for q in reversed(incoming):
+        suffix.append(_add_cell(suffix[-1], q))
+    suffix.reverse()
+    messages = []
+    for i in range(n):
+        before = prefix[i]
+        after = suffix[i + 1]
+        totals = []
+        for target in (count - 1, count):
+            total = 0.0
+            for a in range(max(0, target - len(after) + 1), min(target, len(before) - 1) + 1):
+                total += before[a] * after[target - a]
+            totals.append(total)
+        mine, safe = totals
+        messages.append(mine / (mine + safe) if mine + safe else 0.5)
+    return messages
+
+
+def belief_propagation(knowledge, unknown, mines_left, iterations=50, tolerance=1e-4,
+                       damping=0.5, deadline=None):
+    """
+    Approximate mine probabilities by loopy belief propagation (sum-product)
+    on the factor graph with one variable per frontier cell and one factor
+    per sentence, "exactly count of these cells are mines". Every cell
+    starts from the global density mines_left / len(unknown); unconstrained
+    cells share the mines the frontier is not expected to hold. Each
+    iteration costs time linear in the number of sentence cells. Once
+    time.perf_counter() passes deadline the current beliefs are returned.
+    Returns (probabilities, converged).
+    """
+    if not unknown:
+        return {}, True
+    prior = min(max(mines_left / len(unknown), 0.0), 1.0)
+    sentences = [(list(cells), count) for cells, count in knowledge if cells]
+    memberships = {}
+    for f, (cells, _) in enumerate(sentences):
+        for i, cell in enumerate(cells):
+            memberships.setdefault(cell, []).append((f, i))
+    # Messages are the normalised probability of "mine"
+    to_cell = [[0.5] * len(cells) for cells, _ in sentences]
+    to_factor = [[prior] * len(cells) for cells, _ in sentences]
+
+    def belief(cell, skip=None):
+        mine = prior
+        safe = 1 - prior
+        for f, i in memberships[cell]:
+            if f != skip:
+                mine *= to_cell[f][i]
+                safe *= 1 - to_cell[f][i]
+        return mine / (mine + safe) if mine + safe else 0.5
+
+    converged = False
+    for _ in range(iterations):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        change = 0.0
+        for f, (_, count) in enumerate(sentences):
+            old = to_cell[f]
+            new = _factor_messages(to_factor[f], count)
+            for i, message in enumerate(new):
+                message = damping * old[i] + (1 - damping) * message
+                change = max(change, abs(message - old[i]))
+                old[i] = message
+        for cell, links in memberships.items():
+            for f, i in links:
+                to_factor[f][i] = belief(cell, skip=f)
+        if change < tolerance:
+            converged = True
+            break
+
+    probabilities = {cell: belief(cell) for cell in memberships}
+    others = [cell for cell in unknown if cell not in memberships]
+    if others:
+        expected = sum(probabilities.values())
+        p = min(max((mines_left - expected) / len(others), 0.0), 1.0)
+        for cell in others:
+            probabilities[cell] = p
+    return probabilities, converged
@@ -0,0 +1,286 @@
+"""
+Regression benchmark over a pinned corpus of seeded boards.
+
+corpus.json lists the configurations (beginner, intermediate, expert) with
+the seed and number of games of each. Boards and the AI's random choices
+come from the per-game seeds (see benchmark.game_seed), so every run plays
+the same games. Each configuration also stores a checksum of its mine
+layouts, so a change to board generation is caught instead of silently
+benchmarking different boards; regenerate the corpus with a new version
+when that is intended.
+
+A run records, per configuration, the win rate, moves per second, p50 and
+p99 smart_move latency and the peak traced memory of a few games. With
+--update the results become the baselines; otherwise they are compared
+with them and the command exits with status 1 if any metric regressed by
+more than its threshold. The win rate and peak memory do not depend on the
+machine and go to the baseline file kept in the repository. Timings do, so
+they go to a separate timings file that stays on the machine (or CI
+runner) that recorded it; without one, timings are not checked.
+
+A win rate only counts as a regression when it drops by more than
+WIN_RATE_Z standard errors of the difference between two runs of the
+configuration's games, so a change that merely takes other guesses on a
+few games passes, and larger corpora catch smaller drops.
+
+    python regression.py --update
+    python regression.py --configs beginner expert --threshold p99_ms=0.5
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import time
+
+from benchmark import ai_options_from, game_seed, peak_memory, run_benchmark, run_parallel
+from minesweeper import Minesweeper
+
+CORPUS = "corpus.json"
+BASELINE = "baseline.json"
+TIMINGS = "timings.json"
+CORPUS_VERSION = 1
+
+CONFIGS = (
+    ("beginner", 9, 9, 10, 500),
+    ("intermediate", 16, 16, 40, 300),
+    ("expert", 16, 30, 99, 200),
+)
+
+# Metric: (direction, allowed change). Higher-is-better metrics may drop
+# and lower-is-better ones may rise by the allowed fraction; win_rate
+# changes are in standard errors (a two-sided 99% interval).
+WIN_RATE_Z = 2.58
+THRESHOLDS = {
+    "win_rate": ("higher", WIN_RATE_Z),
+    "moves_per_sec": ("higher", 0.25),
+    "p50_ms": ("lower", 0.5),
+    "p99_ms": ("lower", 0.5),
+    "peak_mb": ("lower", 0.2),
+}
+# Metrics that depend on the machine, kept out of the repository baseline
+TIMING_METRICS = ("moves_per_sec", "p50_ms", "p99_ms")
+
+
+def board_checksum(height, width, mines, first_move, seed, games):
+    """
+    SHA-256 of the mine layouts of the games of a configuration.
+    """
+    digest = hashlib.sha256()
+    for index in range(games):
+        board = Minesweeper(height=height, width=width, mines=mines, safe_cell=first_move,
+                            rng=random.Random(game_seed(seed, index)))
+        digest.update(json.dumps(sorted(board.mines)).encode())
+    return digest.hexdigest()
+
+
+def build_corpus(seed=20240101, configs=CONFIGS):
+    corpus = {"version": CORPUS_VERSION, "configs": []}
+    for name, height, width, mines, games in configs:
+        first_move = (min(3, height - 1), min(3, width - 1))
+        corpus["configs"].append({
+            "name": name,
+            "height": height,
+            "width": width,
+            "mines": mines,
+            "first_move": list(first_move),
+            "seed": seed,
+            "games": games,
+            "checksum": board_checksum(height, width, mines, first_move, seed, games),
+        })
+    return corpus
+
+
+def run_config(config, ai_options=None, workers=1, memory_games=3, repeat=3):
+    """
+    Play the games of a corpus configuration and return its metrics. The
+    games are played repeat times and the best timings kept, which removes
+    most of the noise from other load on the machine. Raises ValueError if
+    the boards no longer match the corpus.
+    """
+    height, width, mines = config["height"], config["width"], config["mines"]
+    first_move = tuple(config["first_move"])
+    checksum = board_checksum(height, width, mines, first_move, config["seed"], config["games"])
+    if checksum != config["checksum"]:
+        raise ValueError(f"{config['name']}: boards differ from the corpus; "
+                         "board generation changed, rebuild the corpus with a new version")
+    metrics = None
+    for _ in range(repeat):
+        if workers == 1:
+            stats = run_benchmark(config["games"], height, width, mines, first_move, config["seed"],
+                                  ai_options=ai_options)
+        else:
+            stats = run_parallel(config["games"], height, width, mines, first_move, config["seed"],
+                                 workers or None, max(1, config["games"] // 20),
+                                 ai_options=ai_options)
+        run = {
+            "games": stats.games,
+            "win_rate": stats.wins / stats.games if stats.games else 0.0,
+            "moves_per_sec": stats.moves / stats.elapsed if stats.elapsed else 0.0,
+            "p50_ms": stats.latency.percentile(50) * 1000,
+            "p99_ms": stats.latency.percentile(99) * 1000,
+        }
+        if metrics is None:
+            metrics = run
+        else:
+            metrics["moves_per_sec"] = max(metrics["moves_per_sec"], run["moves_per_sec"])
+            metrics["p50_ms"] = min(metrics["p50_ms"], run["p50_ms"])
+            metrics["p99_ms"] = min(metrics["p99_ms"], run["p99_ms"])
+    peak, _ = peak_memory(min(memory_games, config["games"]), height, width, mines, first_move,
+                          config["seed"], ai_options=ai_options)
+    metrics["peak_mb"] = peak / 2 ** 20
+    return metrics
+
+
+def win_rate_error(old, new):
+    """
+    Standard error of the difference between two win rates given as
+    {"win_rate", "games"} metrics, from their pooled rate.
+    """
+    games = old.get("games") or 0
+    new_games = new.get("games") or 0
+    if not games or not new_games:
+        return 0.0
+    pooled = (old["win_rate"] * games + new["win_rate"] * new_games) / (games + new_games)
+    return math.sqrt(pooled * (1 - pooled) * (1 / games + 1 / new_games))
+
+
+def compare(results, baseline, thresholds=THRESHOLDS):
+    """
+    Regressions of results against baseline as a list of messages.
+    Metrics missing from either side are not compared.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, (direction, allowed) in thresholds.items():
+            old = baseline[name].get(metric)
+            new = metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == "win_rate":
+                error = win_rate_error(baseline[name], metrics)
+                if error:
+                    change = (old - new) / error
+                else:
+                    change = math.inf if new < old else 0.0
+            elif not old:
+                continue
+            elif direction == "higher":
+                change = (old - new) / old
+            else:
+                change = (new - old) / old
+            if change > allowed:
+                sign = "-" if direction == "higher" else "+"
+                kind = " standard errors" if metric == "win_rate" else " relative"
+                regressions.append(f"{name} {metric}: {old:.4g} -> {new:.4g} "
+                                   f"(allowed {sign}{allowed:g}{kind})")
+    return regressions
+
+
+def load_baseline(path, corpus):
+    """
+    Results of a baseline file, checked against the corpus version.
+    """
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline["corpus_version"] != corpus["version"]:
+        raise SystemExit(f"{path} was recorded on another corpus version; refresh it with --update")
+    return baseline["results"]
+
+
+def parse_threshold(text):
+    metric, _, value = text.partition("=")
+    if metric not in THRESHOLDS or not value:
+        raise argparse.ArgumentTypeError(f"expected METRIC=VALUE with METRIC in {', '.join(THRESHOLDS)}")
+    return metric, float(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Regression benchmark over the pinned corpus.")
+    parser.add_argument("--corpus", default=CORPUS, help="corpus file")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline of the machine-independent metrics")
+    parser.add_argument("--timings", default=TIMINGS,
+                        help="this machine's timing baseline, kept out of the repository")
+    parser.add_argument("--build-corpus", action="store_true",
+                        help="write a new corpus file from the built-in configurations and exit")
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--configs", nargs="+", metavar="NAME", help="run only these configurations")
+    parser.add_argument("--threshold", type=parse_threshold, action="append", default=[],
+                        metavar="METRIC=VALUE", help="override an allowed change")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, 0 for one per CPU (default 1)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per configuration; the best timings are kept")
+    parser.add_argument("--memory-games", type=int, default=3,
+                        help="games per configuration played under tracemalloc")
+    parser.add_argument("--simulations", type=int)
+    parser.add_argument("--simulation-time", type=float)
+    parser.add_argument("--batched-sampling", action="store_true")
+    parser.add_argument("--sat", action="store_true")
+    parser.add_argument("--deadline", type=float)
+    parser.add_argument("--max-sentences", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.build_corpus:
+        with open(args.corpus, "w") as file:
+            json.dump(build_corpus(), file, indent=2)
+            file.write("\n")
+        return 0
+    with open(args.corpus) as file:
+        corpus = json.load(file)
+    if corpus["version"] != CORPUS_VERSION:
+        raise SystemExit(f"{args.corpus} is corpus version {corpus['version']}, "
+                         f"expected {CORPUS_VERSION}")
+    ai_options = ai_options_from(args)
+    thresholds = dict(THRESHOLDS)
+    for metric, value in args.threshold:
+        thresholds[metric] = (thresholds[metric][0], value)
+    results = {}
+    start = time.perf_counter()
+    for config in corpus["configs"]:
+        if args.configs and config["name"] not in args.configs:
+            continue
+        results[config["name"]] = metrics = run_config(config, ai_options, args.workers,
+                                                       args.memory_games, args.repeat)
+        print(f"{config['name']:<13} win {metrics['win_rate']:6.1%}  "
+              f"{metrics['moves_per_sec']:9.0f} moves/s  p50 {metrics['p50_ms']:.3f}ms  "
+              f"p99 {metrics['p99_ms']:.3f}ms  peak {metrics['peak_mb']:.2f}MB", flush=True)
+    print(f"{time.perf_counter() - start:.1f}s", file=sys.stderr)
+    timings = {name: {metric: value for metric, value in metrics.items()
+                      if metric in TIMING_METRICS or metric == "games"}
+               for name, metrics in results.items()}
+    portable = {name: {metric: value for metric, value in metrics.items()
+                       if metric not in TIMING_METRICS}
+                for name, metrics in results.items()}
+    if args.update:
+        for path, values in ((args.baseline, portable), (args.timings, timings)):
+            with open(path, "w") as file:
+                json.dump({"corpus_version": corpus["version"], "results": values}, file, indent=2)
+                file.write("\n")
+        return 0
+    try:
+        baseline = load_baseline(args.baseline, corpus)
+    except FileNotFoundError:
+        raise SystemExit(f"no baseline at {args.baseline}; create one with --update")
+    regressions = compare(portable, baseline, thresholds)
+    try:
+        regressions += compare(timings, load_baseline(args.timings, corpus), thresholds)
+    except FileNotFoundError:
+        print(f"no timing baseline at {args.timings}; timings not checked "
+              "(record one on this machine with --update)")
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Replay games recorded with benchmark.py --trace.
+
+By default every selected game is played again from its seed: the board
+and the AI's random choices are regenerated exactly, so the replayed moves
+match the trace unless the AI changed (or time budgets such as --deadline
+cut moves short differently). The first move that differs is reported,
+which makes a trace a regression test for the AI.
+
+With --feed the recorded moves are fed to a fresh MinesweeperAI on the
+recorded mine layout instead, timing smart_move at every position the game
+reached. Traces without a seed can only be fed.
+
+    python benchmark.py --games 1000 --height 16 --width 30 --mines 99 --seed 1 --trace games.bin
+    python replay.py games.bin --lost --slower-than 0.5 --profile
+"""
+import argparse
+import random
+import sys
+
+from benchmark import BenchmarkStats, ai_options_from, format_report, play_game
+from gametrace import read_traces
+from minesweeper import Minesweeper, MinesweeperAI
+
+
+class _Collector:
+    """
+    Trace writer that keeps the games in memory.
+    """
+    def __init__(self):
+        self.games = []
+
+    def write(self, game):
+        self.games.append(game)
+
+
+def board_class_for(name):
+    if name == "ArrayMinesweeper":
+        from board import ArrayMinesweeper
+        return ArrayMinesweeper
+    if name == "Minesweeper":
+        return Minesweeper
+    raise ValueError(f"unknown board class {name}")
+
+
+def board_from_trace(game):
+    """
+    Minesweeper board with the recorded mine layout.
+    """
+    board = Minesweeper(height=game.height, width=game.width, mines=0, safe_cell=game.first_move)
+    board.totalMines = game.mines
+    for i, j in game.mine_cells:
+        board.board[i][j] = True
+    board.mines = set(game.mine_cells)
+    return board
+
+
+def first_difference(recorded, replayed):
+    """
+    Index of the first move that differs between two GameTraces, or None.
+    """
+    for index, (old, new) in enumerate(zip(recorded.moves, replayed.moves)):
+        if old.cell != new.cell:
+            return index
+    if len(recorded.moves) != len(replayed.moves):
+        return min(len(recorded.moves), len(replayed.moves))
+    return None
+
+
+def replay(game, stats, ai_options=None):
+    """
+    Play a traced game again from its seed. Returns the replayed GameTrace.
+    """
+    if game.seed is None:
+        raise ValueError("the trace has no seed; use --feed")
+    collector = _Collector()
+    play_game(game.height, game.width, game.mines, game.first_move, stats,
+              random.Random(game.seed), board_class_for(game.board_class), ai_options,
+              seed=game.seed, trace=collector, board_options={"opening": game.opening})
+    replayed = collector.games[0]
+    if replayed.mine_cells != game.mine_cells:
+        raise ValueError("the seed does not reproduce the recorded board")
+    return replayed
+
+
+def feed(game, stats, ai_options=None):
+    """
+    Feed the recorded moves to a fresh AI on the recorded board, asking it
+    for a move at every position. Returns the number of positions where it
+    chose the recorded move.
+    """
+    board = board_from_trace(game)
+    ai = MinesweeperAI(height=game.height, width=game.width, mines=game.mines,
+                       rng=random.Random(game.seed))
+    for name, value in (ai_options or {}).items():
+        setattr(ai, name, value)
+    ai.instrument = stats
+    agreed = 0
+    for index, move in enumerate(game.moves):
+        if index:
+            agreed += ai.smart_move() == move.cell
+        cells = board.reveal(move.cell)
+        if cells is None:
+            break
+        ai.add_knowledge_batch(cells)
+    stats.games += 1
+    stats.wins += game.result == "won"
+    stats.losses += game.result == "lost"
+    stats.stuck += game.result == "stuck"
+    return agreed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay games from a binary trace.")
+    parser.add_argument("trace", help="trace file written by benchmark.py --trace")
+    parser.add_argument("--game", type=int, action="append",
+                        help="replay only this game (index in the file, may be repeated)")
+    parser.add_argument("--lost", action="store_true", help="replay only lost games")
+    parser.add_argument("--slower-than", type=float, metavar="SECONDS",
+                        help="replay only games with a move slower than this")
+    parser.add_argument("--feed", action="store_true",
+                        help="feed the recorded moves instead of replaying from the seed")
+    parser.add_argument("--profile", action="store_true", help="print the stage timing report")
+    parser.add_argument("--simulations", type=int)
+    parser.add_argument("--simulation-time", type=float)
+    parser.add_argument("--batched-sampling", action="store_true")
+    parser.add_argument("--sat", action="store_true")
+    parser.add_argument("--deadline", type=float)
+    parser.add_argument("--max-sentences", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ai_options = ai_options_from(args)
+    stats = BenchmarkStats()
+    diverged = 0
+    with open(args.trace, "rb") as file:
+        for index, game in enumerate(read_traces(file)):
+            if args.game and index not in args.game:
+                continue
+            if args.lost and game.result != "lost":
+                continue
+            slowest = game.slowest()
+            if args.slower_than is not None and (slowest is None or slowest.seconds < args.slower_than):
+                continue
+            line = (f"game {index}: {game.result} in {len(game.moves)} moves, "
+                    f"slowest {slowest.seconds * 1000:.1f}ms ({slowest.stage})")
+            if args.feed:
+                agreed = feed(game, stats, ai_options)
+                line += f"; fed, AI agreed on {agreed}/{max(0, len(game.moves) - 1)} moves"
+            else:
+                replayed = replay(game, stats, ai_options)
+                difference = first_difference(game, replayed)
+                if difference is None:
+                    line += f"; replayed identically ({replayed.seconds() * 1000:.1f}ms)"
+                else:
+                    diverged += 1
+                    line += (f"; replay {replayed.result}, diverged at move {difference}")
+            print(line)
+    if args.profile:
+        print(format_report(stats.summary()))
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
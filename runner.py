@@ -1,13 +1,42 @@
-import pygame
+import argparse
+import queue
 import sys
-import time
+import threading
+
+import pygame
 
+from benchmark import mines_for
+from layout import BoardLayout
 from minesweeper import Minesweeper, MinesweeperAI
 
-HEIGHT = 9
-WIDTH = 9
-MINES = 10
-SAFE_Cell = (3, 3)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Watch the Minesweeper AI play.")
+    parser.add_argument("--height", type=int, default=9)
+    parser.add_argument("--width", type=int, default=9)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--mines", type=int, help="number of mines (default 10 on 9x9)")
+    group.add_argument("--density", type=float, help="fraction of cells that are mines")
+    parser.add_argument("--first-move", type=int, nargs=2, metavar=("I", "J"),
+                        help="first cell revealed, guaranteed safe (default (3, 3) clipped to the board)")
+    parser.add_argument("--opening", action="store_true",
+                        help="keep the first move's neighbours free of mines, so it opens an area")
+    return parser.parse_args(argv)
+
+
+args = parse_args()
+if args.mines is None and args.density is None and (args.height, args.width) == (9, 9):
+    args.mines = 10
+HEIGHT = args.height
+WIDTH = args.width
+MINES = mines_for(HEIGHT, WIDTH, args.mines, args.density)
+SAFE_Cell = tuple(args.first_move) if args.first_move else (min(3, HEIGHT - 1), min(3, WIDTH - 1))
+OPENING = args.opening
+
+# Frame rate cap of the render loop
+FPS = 60
+# Most rectangles a frame updates; more changed cells are grouped by region
+MAX_DIRTY_RECTS = 256
 
 # Colors
 BLACK = (0, 0, 0)
@@ -16,8 +45,9 @@ WHITE = (255, 255, 255)
 
 # Create game
 pygame.init()
-size = width, height = 500,500
+size = width, height = 500, 500
 screen = pygame.display.set_mode(size)
+clock = pygame.time.Clock()
 
 # Fonts
 OPEN_SANS = "assets/fonts/OpenSans-Regular.ttf"
@@ -29,8 +59,15 @@ largeFont = pygame.font.Font(OPEN_SANS, 20)
 BOARD_PADDING = 10
 board_width = ((2 / 3) * width) - (BOARD_PADDING * 2)
 board_height = height - (BOARD_PADDING * 2)
-cell_size = int(min(board_width / WIDTH, board_height / HEIGHT))
-board_origin = (BOARD_PADDING, BOARD_PADDING)
+# Boards too large for the window are shown through a viewport the arrow keys scroll
+layout = BoardLayout(HEIGHT, WIDTH, (BOARD_PADDING, BOARD_PADDING, board_width, board_height))
+cell_size = layout.cell_size
+SCROLL_KEYS = {
+    pygame.K_UP: (-1, 0),
+    pygame.K_DOWN: (1, 0),
+    pygame.K_LEFT: (0, -1),
+    pygame.K_RIGHT: (0, 1),
+}
 
 # Add images
 flag = pygame.image.load("assets/images/flag.png")
@@ -38,238 +75,315 @@ flag = pygame.transform.scale(flag, (cell_size, cell_size))
 mine = pygame.image.load("assets/images/mine.png")
 mine = pygame.transform.scale(mine, (cell_size, cell_size))
 
-# Create game and AI agent
-game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES, safe_cell=SAFE_Cell)
-ai = MinesweeperAI(height=HEIGHT, width=WIDTH, mines=MINES)
+# Number glyphs rendered once, indexed by the count of nearby mines
+numbers = [smallFont.render(str(count), True, BLACK) for count in range(9)]
+
+# Buttons
+playButton = pygame.Rect((width / 4), (3 / 4) * height, width / 2, 50)
+aiPlay = pygame.Rect(
+    (2 / 3) * width + BOARD_PADDING, (1 / 3) * height - 130,
+    (width / 3) - BOARD_PADDING * 2, 50
+)
+resetButton = pygame.Rect(
+    (2 / 3) * width + BOARD_PADDING, (1 / 3) * height + 20,
+    (width / 3) - BOARD_PADDING * 2, 50
+)
+ai100Play = pygame.Rect(
+    (2 / 3) * width + BOARD_PADDING, (1 / 3) * height + 200,
+    (width / 3) - BOARD_PADDING * 1, 50
+)
+panel = pygame.Rect((2 / 3) * width, 0, width / 3, height)
+
+
+def new_game():
+    return Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES, safe_cell=SAFE_Cell, opening=OPENING)
+
+
+class BoardView:
+    """
+    What the window shows of a game. Every change marks the cells it
+    touches as dirty, so a frame only redraws those cells.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = {}
+        self.flags = set()
+        self.shown_mines = set()
+        self.lost = False
+        self.status = ""
+        self.dirty = set()
+        self.panel_dirty = True
+
+    def reveal(self, cells):
+        for cell, count in cells:
+            self.counts[cell] = count
+            self.dirty.add(cell)
+
+    def toggle_flag(self, cell):
+        if cell in self.counts:
+            return
+        if cell in self.flags:
+            self.flags.remove(cell)
+        else:
+            self.flags.add(cell)
+        self.dirty.add(cell)
+
+    def set_flags(self, cells):
+        self.dirty.update(self.flags.symmetric_difference(cells))
+        self.flags = set(cells)
+
+    def show_mines(self, cells):
+        self.lost = True
+        self.shown_mines = set(cells)
+        self.dirty.update(cells)
+
+    def set_status(self, text):
+        if text != self.status:
+            self.status = text
+            self.panel_dirty = True
+
+
+class AIWorker(threading.Thread):
+    """
+    Plays games in the background and posts what happens to a queue, so the
+    render loop never waits for the AI:
+
+        ("new_game", index)       game index of a batch starts on a new board
+        ("reveal", cells)         (cell, nearby mines) pairs revealed by a move
+        ("lost", mines)           a mine was hit; mines is the board's mines
+        ("done", flags)           no moves left; flags are the mines the AI found
+        ("finished", wins, games) every game has been played
+    """
+    def __init__(self, events, games=1, game=None):
+        super().__init__(daemon=True)
+        self.events = events
+        self.games = games
+        self.game = game
+        self.stop = threading.Event()
+
+    def run(self):
+        wins = 0
+        for index in range(self.games):
+            if self.stop.is_set():
+                return
+            game = self.game
+            if game is None or index > 0:
+                game = new_game()
+                self.events.put(("new_game", index))
+            ai = MinesweeperAI(height=HEIGHT, width=WIDTH, mines=MINES)
+            wins += self.play(game, ai)
+        self.events.put(("finished", wins, self.games))
+
+    def play(self, game, ai):
+        """
+        Play one game to the end. Returns True unless a mine was hit.
+        """
+        move = SAFE_Cell
+        while not self.stop.is_set():
+            cascade = game.reveal(move)
+            if cascade is None:
+                self.events.put(("lost", set(game.mines)))
+                return False
+            self.events.put(("reveal", cascade))
+            ai.add_knowledge_batch(cascade)
+            move = ai.smart_move()
+            if move is None:
+                self.events.put(("done", set(ai.mines)))
+                return True
+        return False
+
+
+def draw_cell(view, cell):
+    """
+    Draw one cell and return its rectangle.
+    """
+    rect = pygame.Rect(layout.cell_rect(cell))
+    pygame.draw.rect(screen, GRAY, rect)
+    pygame.draw.rect(screen, WHITE, rect, 3)
+    if cell in view.shown_mines:
+        screen.blit(mine, rect)
+    elif cell in view.flags:
+        screen.blit(flag, rect)
+    elif cell in view.counts:
+        glyph = numbers[view.counts[cell]]
+        screen.blit(glyph, glyph.get_rect(center=rect.center))
+    return rect
+
+
+def draw_button(rect, label):
+    text = mediumFont.render(label, True, BLACK)
+    pygame.draw.rect(screen, WHITE, rect)
+    screen.blit(text, text.get_rect(center=rect.center))
+
+
+def draw_panel(view):
+    """
+    Draw the buttons and the game status and return the panel rectangle.
+    """
+    pygame.draw.rect(screen, BLACK, panel)
+    draw_button(ai100Play, "AIPlay-100 Games")
+    draw_button(aiPlay, "AI Play")
+    draw_button(resetButton, "Reset")
+    text = mediumFont.render(view.status, True, WHITE)
+    screen.blit(text, text.get_rect(center=((5 / 6) * width, (2 / 3) * height)))
+    return panel
+
+
+def draw_instructions():
+    screen.fill(BLACK)
+
+    # Title
+    title = largeFont.render("Play Minesweeper", True, WHITE)
+    screen.blit(title, title.get_rect(center=((width / 2), 50)))
+
+    # Rules
+    rules = [
+        "Click AI Play to start.",
+        "AI makes a safe first move.",
+        "It plays using logic to avoid mines.",
+        "If stuck, it uses probability to pick a safe cell.",
+        "Game results are shown at the end. ",
+        "Reset to play again."
+    ]
+    for i, rule in enumerate(rules):
+        line = largeFont.render(rule, True, WHITE)
+        screen.blit(line, line.get_rect(center=((width / 2), 150 + 30 * i)))
 
-# Keep track of revealed cells, flagged cells, and if a mine was hit
-revealed = set()
-flags = set()
-lost = False
+    # Play game button
+    draw_button(playButton, "Play Game")
+
+
+def draw_all(view):
+    screen.fill(BLACK)
+    for cell in layout.visible_cells():
+        draw_cell(view, cell)
+    view.dirty.clear()
+    draw_panel(view)
+    view.panel_dirty = False
+
+
+def apply_event(view, event):
+    """
+    Show one event posted by the AI worker.
+    """
+    kind = event[0]
+    if kind == "new_game":
+        view.clear()
+        view.set_status(f"Game {event[1] + 1}")
+        return True
+    if kind == "reveal":
+        view.reveal(event[1])
+    elif kind == "lost":
+        view.show_mines(event[1])
+        view.set_status("Lost")
+        print("AI Lost ------------------------------")
+    elif kind == "done":
+        view.set_flags(event[1])
+        view.set_status("Won" if len(event[1]) == MINES else "")
+        print("No moves left to make.")
+    elif kind == "finished" and event[2] > 1:
+        view.set_status(f"Won {event[1]}/{event[2]}")
+        print(f"AI won {event[1]} out of {event[2]} games.")
+    return False
+
+
+def stop_worker(worker):
+    if worker is not None:
+        worker.stop.set()
+        worker.join()
+
+
+# Create game and AI worker state
+game = new_game()
+view = BoardView()
+events = queue.Queue()
+worker = None
 
 # Show instructions initially
 instructions = True
+draw_instructions()
+pygame.display.flip()
 
 while True:
 
-    # Check if game quit
+    redraw = False
+
+    # Handle input without blocking on the AI
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            stop_worker(worker)
             sys.exit()
+        if event.type == pygame.KEYDOWN and event.key in SCROLL_KEYS and not instructions:
+            # Scroll by a quarter of the viewport
+            di, dj = SCROLL_KEYS[event.key]
+            step_rows = max(1, layout.visible_rows // 4)
+            step_cols = max(1, layout.visible_cols // 4)
+            redraw = layout.scroll(di * step_rows, dj * step_cols) or redraw
+            continue
+        if event.type != pygame.MOUSEBUTTONDOWN:
+            continue
 
-    screen.fill(BLACK)
-
-    # Show game instructions
-    if instructions:
-
-        # Title
-        title = largeFont.render("Play Minesweeper", True, WHITE)
-        titleRect = title.get_rect()
-        titleRect.center = ((width / 2), 50)
-        screen.blit(title, titleRect)
-
-        # Rules
-        rules = [
-            "Click AI Play to start.",
-            "AI makes a safe first move.",
-            "It plays using logic to avoid mines.",
-            "If stuck, it uses probability to pick a safe cell.",
-            "Game results are shown at the end. ",
-            "Reset to play again."
-        ]
-        for i, rule in enumerate(rules):
-            line = (largeFont.render(rule, True, WHITE))
-            lineRect = line.get_rect()
-            lineRect.center = ((width / 2), 150 + 30 * i)
-            screen.blit(line, lineRect)
-
-        # Play game button
-        buttonRect = pygame.Rect((width / 4), (3 / 4) * height, width / 2, 50)
-        buttonText = mediumFont.render("Play Game", True, BLACK)
-        buttonTextRect = buttonText.get_rect()
-        buttonTextRect.center = buttonRect.center
-        pygame.draw.rect(screen, WHITE, buttonRect)
-        screen.blit(buttonText, buttonTextRect)
-
-        # Check if play button clicked
-        click, _, _ = pygame.mouse.get_pressed()
-        if click == 1:
-            mouse = pygame.mouse.get_pos()
-            if buttonRect.collidepoint(mouse):
+        if instructions:
+            if event.button == 1 and playButton.collidepoint(event.pos):
                 instructions = False
-                time.sleep(0.3)
-
-        pygame.display.flip()
-        continue
-
-    # Draw board
-    cells = []
-    for i in range(HEIGHT):
-        row = []
-        for j in range(WIDTH):
-
-            # Draw rectangle for cell
-            rect = pygame.Rect(
-                board_origin[0] + j * cell_size,
-                board_origin[1] + i * cell_size,
-                cell_size, cell_size
-            )
-            pygame.draw.rect(screen, GRAY, rect)
-            pygame.draw.rect(screen, WHITE, rect, 3)
-
-            # Add a mine, flag, or number if needed
-            if game.is_mine((i, j)) and lost:
-                screen.blit(mine, rect)
-            elif (i, j) in flags:
-                screen.blit(flag, rect)
-            elif (i, j) in revealed:
-                neighbors = smallFont.render(
-                    str(game.nearby_mines((i, j))),
-                    True, BLACK
-                )
-                neighborsTextRect = neighbors.get_rect()
-                neighborsTextRect.center = rect.center
-                screen.blit(neighbors, neighborsTextRect)
-
-            row.append(rect)
-        cells.append(row)
-
-    # AI Play 100 games button
-    ai100Play = pygame.Rect(
-        (2 / 3) * width + BOARD_PADDING, (1 / 3) * height + 200,
-        (width / 3) - BOARD_PADDING * 1, 50
-    )
-    buttonText = mediumFont.render("AIPlay-100 Games", True, BLACK)
-    buttonRect = buttonText.get_rect()
-    buttonRect.center = ai100Play.center
-    pygame.draw.rect(screen, WHITE, ai100Play)
-    screen.blit(buttonText, buttonRect)
-
-    # AI Play button
-    aiPlay = pygame.Rect(
-        (2 / 3) * width + BOARD_PADDING, (1 / 3) * height - 130,
-        (width / 3) - BOARD_PADDING * 2, 50
-    )
-    buttonText = mediumFont.render("AI Play", True, BLACK)
-    buttonRect = buttonText.get_rect()
-    buttonRect.center = aiPlay.center
-    pygame.draw.rect(screen, WHITE, aiPlay)
-    screen.blit(buttonText, buttonRect)
-
-    # Reset button
-    resetButton = pygame.Rect(
-        (2 / 3) * width + BOARD_PADDING, (1 / 3) * height + 20,
-        (width / 3) - BOARD_PADDING * 2, 50
-    )
-    buttonText = mediumFont.render("Reset", True, BLACK)
-    buttonRect = buttonText.get_rect()
-    buttonRect.center = resetButton.center
-    pygame.draw.rect(screen, WHITE, resetButton)
-    screen.blit(buttonText, buttonRect)
-
-    # Display text
-    text = "Lost" if lost else "Won" if game.mines == flags else ""
-    text = mediumFont.render(text, True, WHITE)
-    textRect = text.get_rect()
-    textRect.center = ((5 / 6) * width, (2 / 3) * height)
-    screen.blit(text, textRect)
-
-    move = None
-    first_move_done = False
-
-    left, _, right = pygame.mouse.get_pressed()
-
-    # Check for a right-click to toggle flagging
-    if right == 1 and not lost:
-        mouse = pygame.mouse.get_pos()
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if cells[i][j].collidepoint(mouse) and (i, j) not in revealed:
-                    if (i, j) in flags:
-                        flags.remove((i, j))
-                    else:
-                        flags.add((i, j))
-                    time.sleep(0.2)
-
-    elif left == 1:
-        mouse = pygame.mouse.get_pos()
-
-        if aiPlay.collidepoint(mouse) and not lost:
-                while not lost:
-                    if not first_move_done:
-                        move = SAFE_Cell
-                        print("First Move.")
-                        first_move_done = True
-                    elif first_move_done:
-                        move = ai.smart_move()
-                    if move is None:
-                        flags = ai.mines.copy()
-                        print("No moves left to make.")
-                        break
-                    if move:
-                        if game.is_mine(move):
-                            lost = True
-                            print("AI Lost ------------------------------")
-                        else:
-                            nearby = game.nearby_mines(move)
-                            revealed.add(move)
-                            ai.add_knowledge(move, nearby)
-
-                pygame.display.flip()
-                time.sleep(0.2)
-
-        #If AIPlay-100 clicked, make an AI move
-        elif ai100Play.collidepoint(mouse) :
-            ai_wins = 0
-            counter = 0
-            for i in range(100):
-                game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
-                ai = MinesweeperAI(height=HEIGHT, width=WIDTH, mines=MINES)
-                revealed = set()
-                flags = set()
-                lost = False
-                while not lost:
-                    if not first_move_done:
-                        move = SAFE_Cell
-                        #print("First Move.")
-                        first_move_done = True
-                    elif first_move_done:
-                        move = ai.smart_move()
-                    if move is None:
-                        flags = ai.mines.copy()
-                        print("No moves left to make.")
-                        break
-                    if move:
-                        if game.is_mine(move):
-                            lost = True
-                            if len(ai.get_unrevealed()) >=55:
-                                print("Failed in early steps")
-                            elif len(ai.get_unrevealed()) <=12:
-                                print("Failed in final steps")
-                            print("AI Lost ------------------------------ Identified Mines -", len(ai.mines))
-                        else:
-                            nearby = game.nearby_mines(move)
-                            revealed.add(move)
-                            ai.add_knowledge(move, nearby)
-
-                if not lost:
-                    ai_wins += 1
-                    print(counter)
-                first_move_done = False
-                counter += 1
-            print(f"AI won {ai_wins} out of 100 games.")
-            time.sleep(1)
-
-
-        # Reset game state
-        elif resetButton.collidepoint(mouse):
-            game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
-            ai = MinesweeperAI(height=HEIGHT, width=WIDTH,mines=MINES)
-            revealed = set()
-            flags = set()
-            lost = False
+                redraw = True
             continue
 
+        busy = worker is not None and worker.is_alive()
+
+        # Right-click toggles a flag
+        if event.button == 3 and not view.lost and not busy:
+            cell = layout.cell_at(event.pos)
+            if cell is not None:
+                view.toggle_flag(cell)
+
+        elif event.button == 1:
+            if aiPlay.collidepoint(event.pos) and not view.lost and not busy and not view.counts:
+                worker = AIWorker(events, games=1, game=game)
+                worker.start()
+
+            # AIPlay-100 plays 100 new games in the background
+            elif ai100Play.collidepoint(event.pos) and not busy:
+                worker = AIWorker(events, games=100)
+                worker.start()
+
+            # Reset game state
+            elif resetButton.collidepoint(event.pos):
+                stop_worker(worker)
+                worker = None
+                events = queue.Queue()
+                game = new_game()
+                view = BoardView()
+                redraw = True
+
+    if instructions:
+        clock.tick(FPS)
+        continue
 
-    pygame.display.flip()
+    # Show every move the AI made since the last frame
+    while True:
+        try:
+            item = events.get_nowait()
+        except queue.Empty:
+            break
+        redraw = apply_event(view, item) or redraw
 
+    if redraw:
+        draw_all(view)
+        pygame.display.flip()
+    else:
+        rects = []
+        for rect, cells in layout.regions(view.dirty, MAX_DIRTY_RECTS):
+            for cell in cells:
+                draw_cell(view, cell)
+            rects.append(pygame.Rect(rect))
+        view.dirty.clear()
+        if view.panel_dirty:
+            rects.append(draw_panel(view))
+            view.panel_dirty = False
+        if rects:
+            pygame.display.update(rects)
+
+    clock.tick(FPS)
@@ -0,0 +1,69 @@
+"""
+Vectorized Monte Carlo sampling of mine placements.
+
+Instead of drawing and checking one placement at a time, a whole batch of
+placements is drawn as a boolean NumPy matrix (one row per sample, one
+column per candidate cell), every sentence is checked at once with a
+single constraint-matrix product over the frontier columns, and the mine
+counts of the consistent samples are accumulated in one reduction.
+"""
+import time
+
+import numpy as np
+
+# Upper bound on the number of cells in one sample matrix
+MAX_BATCH_CELLS = 1 << 24
+
+
+def constraint_matrix(knowledge, candidates):
+    """
+    Build the 0/1 matrix of sentences over the frontier columns.
+    Returns (frontier, matrix, targets) where frontier holds the indices in
+    candidates of every cell mentioned by a sentence.
+    """
+    position = {cell: i for i, cell in enumerate(candidates)}
+    sentences = [([position[cell] for cell in cells if cell in position], count)
+                 for cells, count in knowledge]
+    frontier = sorted({i for cells, _ in sentences for i in cells})
+    column = {i: k for k, i in enumerate(frontier)}
+    matrix = np.zeros((len(sentences), len(frontier)), dtype=np.int32)
+    for row, (cells, _) in enumerate(sentences):
+        matrix[row, [column[i] for i in cells]] = 1
+    targets = np.array([count for _, count in sentences], dtype=np.int32)
+    return np.array(frontier, dtype=np.intp), matrix, targets
+
+
+def sample_mine_counts(knowledge, candidates, mines_left, rng, samples=10000,
+                       batch_size=4096, time_budget=None):
+    """
+    Draw up to samples uniform placements of mines_left mines over
+    candidates and keep those consistent with every sentence. Stops early
+    once time_budget seconds have passed. rng is a numpy Generator.
+    Returns (mine_counts, accepted, drawn): mine_counts[i] is the number of
+    accepted samples with a mine on candidates[i].
+    """
+    n = len(candidates)
+    mine_counts = np.zeros(n, dtype=np.int64)
+    if not 0 <= mines_left <= n:
+        return mine_counts, 0, 0
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    frontier, matrix, targets = constraint_matrix(knowledge, candidates)
+    batch_size = max(1, min(batch_size, MAX_BATCH_CELLS // max(n, 1)))
+    accepted = 0
+    drawn = 0
+    while drawn < samples:
+        size = min(batch_size, samples - drawn)
+        mined = np.zeros((size, n), dtype=bool)
+        if mines_left:
+            # The mines_left smallest of n uniform keys are a uniform subset
+            keys = rng.random((size, n))
+            chosen = np.argpartition(keys, mines_left - 1, axis=1)[:, :mines_left]
+            np.put_along_axis(mined, chosen, True, axis=1)
+        counts = mined[:, frontier].astype(np.int32) @ matrix.T
+        consistent = (counts == targets).all(axis=1)
+        mine_counts += mined[consistent].sum(axis=0)
+        accepted += int(consistent.sum())
+        drawn += size
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+    return mine_counts, accepted, drawn
@@ -0,0 +1,252 @@
+"""
+Cardinality-constraint solver for complete local inference.
+
+The knowledge base is a set of cardinality constraints, "exactly count of
+these cells are mines". A cell is a forced safe (mine) when the constraints
+together with the assumption "this cell is a mine (safe)" are
+unsatisfiable. The pairwise rules in MinesweeperAI only combine two
+sentences at a time; asking the solver catches every deduction the
+sentences allow, however many of them it takes.
+
+The solver is a small DPLL search that propagates the constraints natively
+(a constraint whose count is reached makes its other cells safe, one that
+needs all its remaining cells makes them mines) instead of encoding them
+as clauses. It is incremental: constraints are kept between calls and
+synchronised with the knowledge base by sentence id, so only changed
+sentences are re-encoded, and each query is a set of assumptions over the
+same encoding. Every model found is a witness that the cells it assigns
+can take those values, so most cells need no query of their own.
+
+Only the sentences are encoded; the total number of mines left is not.
+
+The search keeps its decisions on an explicit stack, so components of any
+size fit, and the work per forced call is bounded twice: components larger
+than max_cells are left to the probability engines, and queries stop once
+a call has used move_limit search nodes.
+"""
+
+
+class SearchLimit(Exception):
+    """
+    Raised when a query needs more than the solver's node limit.
+    """
+
+
+class CardinalitySolver:
+    """
+    Incremental solver over cardinality constraints keyed by sentence id.
+    node_limit bounds the search nodes of one query, move_limit those of one
+    forced call, and components of more than max_cells cells are skipped.
+    """
+    def __init__(self, node_limit=100000, move_limit=20000, max_cells=100):
+        self.node_limit = node_limit
+        self.move_limit = move_limit
+        self.max_cells = max_cells
+        self.constraints = {}
+        self.masks = {}
+        self.watches = {}
+        self.queries = 0
+        self.nodes = 0
+
+    def add(self, constraint_id, cells, count):
+        self.constraints[constraint_id] = (tuple(cells), count)
+        for cell in cells:
+            self.watches.setdefault(cell, set()).add(constraint_id)
+
+    def remove(self, constraint_id):
+        cells, _ = self.constraints.pop(constraint_id)
+        self.masks.pop(constraint_id, None)
+        for cell in cells:
+            ids = self.watches[cell]
+            ids.discard(constraint_id)
+            if not ids:
+                del self.watches[cell]
+
+    def sync(self, knowledge):
+        """
+        Bring the constraints in line with a KnowledgeBase, re-encoding only
+        the sentences added or changed since the last call.
+        """
+        for constraint_id in [i for i in self.constraints if i not in knowledge.sentences]:
+            self.remove(constraint_id)
+        for sentence_id, sentence in knowledge.sentences.items():
+            key = (sentence.offset, sentence.mask, sentence.count)
+            if self.masks.get(sentence_id) == key:
+                continue
+            if sentence_id in self.constraints:
+                self.remove(sentence_id)
+            if sentence.mask:
+                self.add(sentence_id, knowledge.cells(sentence_id), sentence.count)
+                self.masks[sentence_id] = key
+
+    def component(self, cell):
+        """
+        Cells linked to cell through a chain of constraints.
+        """
+        cells = [cell]
+        seen = {cell}
+        for current in cells:
+            for constraint_id in self.watches.get(current, ()):
+                for other in self.constraints[constraint_id][0]:
+                    if other not in seen:
+                        seen.add(other)
+                        cells.append(other)
+        return cells
+
+    def solve(self, assumptions, cells, node_limit=None):
+        """
+        Find values for cells, a union of components, that satisfy every
+        constraint on them and the assumptions {cell: is_mine}. Returns the
+        model as {cell: is_mine}, or None if there is none. Raises
+        SearchLimit after node_limit (default self.node_limit) search nodes.
+        """
+        node_limit = self.node_limit if node_limit is None else node_limit
+        self.queries += 1
+        ids = {i for cell in cells for i in self.watches.get(cell, ())}
+        mines = {i: 0 for i in ids}
+        free = {i: len(self.constraints[i][0]) for i in ids}
+        value = {}
+        trail = []
+        nodes = 0
+
+        def set_value(cell, is_mine, queue):
+            # Update every constraint on cell before checking, so undo stays exact
+            value[cell] = is_mine
+            trail.append(cell)
+            consistent = True
+            for i in self.watches.get(cell, ()):
+                free[i] -= 1
+                mines[i] += is_mine
+                count = self.constraints[i][1]
+                if mines[i] > count or mines[i] + free[i] < count:
+                    consistent = False
+                queue.append(i)
+            return consistent
+
+        def assign(cell, is_mine):
+            # Returns False on a conflict; the assignment stays on the trail
+            queue = []
+            if not set_value(cell, is_mine, queue):
+                return False
+            while queue:
+                i = queue.pop()
+                constraint_cells, count = self.constraints[i]
+                if not free[i]:
+                    continue
+                if mines[i] == count:
+                    forced = False
+                elif mines[i] + free[i] == count:
+                    forced = True
+                else:
+                    continue
+                for other in constraint_cells:
+                    if other not in value and not set_value(other, forced, queue):
+                        return False
+            return True
+
+        def undo(size):
+            while len(trail) > size:
+                cell = trail.pop()
+                is_mine = value.pop(cell)
+                for i in self.watches.get(cell, ()):
+                    free[i] += 1
+                    mines[i] -= is_mine
+
+        def choose():
+            # An unassigned cell of the open constraint with the fewest free cells
+            best = None
+            for i in ids:
+                if free[i] and (best is None or free[i] < free[best]):
+                    best = i
+            if best is None:
+                return None
+            for cell in self.constraints[best][0]:
+                if cell not in value:
+                    return cell
+
+        def search():
+            # Depth-first over decisions, each on the stack as [cell, trail
+            # size before it, values still to try]; safe is tried first
+            nonlocal nodes
+            stack = []
+            while True:
+                nodes += 1
+                if nodes > node_limit:
+                    raise SearchLimit
+                cell = choose()
+                if cell is None:
+                    return True
+                stack.append((cell, len(trail), [True, False]))
+                while stack:
+                    cell, size, values = stack[-1]
+                    undo(size)
+                    if not values:
+                        stack.pop()
+                    elif assign(cell, values.pop()):
+                        break
+                else:
+                    return False
+
+        try:
+            for cell, is_mine in assumptions.items():
+                if cell in value:
+                    if value[cell] != is_mine:
+                        return None
+                elif not assign(cell, is_mine):
+                    return None
+            if not search():
+                return None
+            return {cell: value[cell] for cell in cells if cell in value}
+        finally:
+            self.nodes += nodes
+
+    def forced(self, knowledge):
+        """
+        Cells of the knowledge base whose value every model agrees on.
+        Returns (safes, mines); cells of an unsatisfiable component or of
+        one larger than max_cells, and cells whose query hit the node limit
+        or came after the move limit, are left out.
+        """
+        self.sync(knowledge)
+        safes = set()
+        mines = set()
+        done = set()
+        end = self.nodes + self.move_limit
+
+        def query(assumptions, cells):
+            if self.nodes >= end:
+                raise SearchLimit
+            return self.solve(assumptions, cells, min(self.node_limit, end - self.nodes))
+
+        for start in list(self.watches):
+            if start in done:
+                continue
+            cells = self.component(start)
+            done.update(cells)
+            if self.max_cells is not None and len(cells) > self.max_cells:
+                continue
+            try:
+                model = query({}, cells)
+            except SearchLimit:
+                continue
+            if model is None:
+                continue
+            seen = {cell: {is_mine} for cell, is_mine in model.items()}
+            fixed = {}
+            for cell in cells:
+                if len(seen[cell]) == 2:
+                    continue
+                is_mine = next(iter(seen[cell]))
+                assumptions = dict(fixed)
+                assumptions[cell] = not is_mine
+                try:
+                    other = query(assumptions, cells)
+                except SearchLimit:
+                    continue
+                if other is None:
+                    fixed[cell] = is_mine
+                    (mines if is_mine else safes).add(cell)
+                    continue
+                for witness, value in other.items():
+                    seen[witness].add(value)
+        return safes, mines
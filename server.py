@@ -0,0 +1,515 @@
+"""
+Asyncio solver service: many clients play games concurrently against
+MinesweeperAI sessions over a Unix socket or localhost TCP.
+
+The protocol is newline-delimited JSON. Every request has an op and an
+optional id, which is echoed in its response so requests can be
+pipelined; a failed request gets {"id": ..., "error": message}.
+
+    {"op": "new", "height": 16, "width": 30, "mines": 99, "seed": 1}
+        -> {"session": 7}
+    {"op": "reveal", "session": 7, "cells": [[i, j, nearby mines], ...]}
+        -> {"queued": n}
+    {"op": "move", "session": 7, "deadline": 0.05}
+        -> {"move": [i, j] or null, "stage": ..., "probability": ...}
+    {"op": "close", "session": 7}
+        -> {"closed": true}
+    {"op": "stats"}
+        -> sessions, request counts and latency percentiles per op
+
+Sessions live in worker processes, each session always on the same one,
+so smart_move never blocks the event loop and its state never crosses a
+process boundary. Revealed cells are only queued by "reveal"; everything
+queued for a session is sent to its worker with the next "move" and added
+with one add_knowledge_batch call. Boards whose cells alone exceed the
+memory limit are refused before a worker builds anything; each session's
+memory is then estimated when it is created and after each move, which
+closes sessions that grew over the limit. Sessions of a worker share
+one ComponentCache, since components are keyed by content.
+
+    python server.py serve --socket /tmp/minesweeper.sock --workers 4
+    python server.py play --socket /tmp/minesweeper.sock --games 1000 --concurrency 200
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import random
+import sys
+import time
+
+from benchmark import LatencyHistogram, game_seed, mines_for
+from minesweeper import Minesweeper, MinesweeperAI
+from probability import ComponentCache
+
+# Default per-session memory limit in bytes
+MEMORY_LIMIT = 64 * 2 ** 20
+# Largest request line accepted
+LINE_LIMIT = 2 ** 24
+
+# State of a worker process: its sessions and their shared cache
+_sessions = {}
+_cache = None
+_memory_limit = MEMORY_LIMIT
+
+
+class ServiceError(Exception):
+    """
+    A request the service rejects; the message is sent to the client.
+    """
+
+
+def _worker_init(memory_limit, cache_size):
+    global _cache, _memory_limit
+    _cache = ComponentCache(cache_size)
+    _memory_limit = memory_limit
+
+
+def _cell_size(height, width):
+    """
+    Average bytes of an (i, j) cell tuple on a board: the tuple and the
+    coordinates too large for CPython's small int cache.
+    """
+    large = max(0, height - 257) / height + max(0, width - 257) / width
+    return sys.getsizeof((0, 0)) + large * sys.getsizeof(2 ** 20)
+
+
+def board_memory(height, width):
+    """
+    Lower bound of the bytes a new session on a height x width board
+    holds: its unrevealed set, one tuple and one 16 byte set entry per cell.
+    """
+    return int(height * width * (_cell_size(height, width) + 16))
+
+
+def session_memory(ai):
+    """
+    Approximate bytes held by a session: the cell sets with their cell
+    tuples, and the knowledge base with its sentences and index.
+    """
+    cell = _cell_size(ai.height, ai.width)
+    cell_sets = (ai.movesMade, ai.mines, ai.safeMoves, ai.unrevealed, ai.pending_safes.positions)
+    size = sum(sys.getsizeof(cells) + len(cells) * cell for cells in cell_sets)
+    size += sys.getsizeof(ai.pending_safes.items)
+    knowledge = ai.knowledge
+    size += sys.getsizeof(knowledge.sentences) + sys.getsizeof(knowledge.index)
+    for sentence in knowledge.sentences.values():
+        size += sys.getsizeof(sentence) + sys.getsizeof(sentence.mask)
+    size += len(knowledge.index) * (sys.getsizeof(set()) + cell)
+    return int(size)
+
+
+def _create(session_id, height, width, mines, seed):
+    ai = MinesweeperAI(height=height, width=width, mines=mines,
+                       rng=random.Random(seed) if seed is not None else None)
+    ai.component_cache = _cache
+    _sessions[session_id] = ai
+    return session_memory(ai)
+
+
+def _step(session_id, revealed, deadline):
+    """
+    Add the queued reveals to a session and ask it for a move.
+    """
+    ai = _sessions.get(session_id)
+    if ai is None:
+        raise ServiceError(f"no session {session_id}")
+    if revealed:
+        ai.add_knowledge_batch([((i, j), count) for i, j, count in revealed])
+    move = ai.smart_move(deadline)
+    memory = session_memory(ai)
+    if memory > _memory_limit:
+        del _sessions[session_id]
+        raise ServiceError(f"session {session_id} closed: {memory} bytes is over the "
+                           f"{_memory_limit} byte limit")
+    return {
+        "move": list(move) if move is not None else None,
+        "stage": ai.last_stage,
+        "probability": ai.probability(move) if move is not None else None,
+        "truncated": ai.truncated,
+        "memory": memory,
+    }
+
+
+def _close(session_id):
+    return _sessions.pop(session_id, None) is not None
+
+
+class Session:
+    """
+    Server-side view of a session: its worker and the reveals queued for
+    the next move.
+    """
+    def __init__(self, session_id, worker, height, width):
+        self.id = session_id
+        self.worker = worker
+        self.height = height
+        self.width = width
+        self.pending = []
+        self.lock = asyncio.Lock()
+
+
+class SolverServer:
+    """
+    Routes requests to sessions on a pool of single-process executors and
+    keeps request latency metrics.
+    """
+    def __init__(self, workers=1, memory_limit=MEMORY_LIMIT, max_sessions=10000,
+                 deadline=None, cache_size=4096):
+        self.executors = [concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, initializer=_worker_init, initargs=(memory_limit, cache_size))
+            for _ in range(workers)]
+        self.memory_limit = memory_limit
+        self.max_sessions = max_sessions
+        self.deadline = deadline
+        self.sessions = {}
+        self.ids = itertools.count()
+        self.latency = {}
+        self.requests = 0
+        self.errors = 0
+        self.batched = 0
+        self.evicted = 0
+        self.connections = 0
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+    async def _call(self, session, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executors[session.worker], function, *args)
+
+    def _session(self, request):
+        session = self.sessions.get(request.get("session"))
+        if session is None:
+            raise ServiceError(f"no session {request.get('session')}")
+        return session
+
+    async def op_new(self, request):
+        if len(self.sessions) >= self.max_sessions:
+            raise ServiceError(f"too many sessions (limit {self.max_sessions})")
+        height = int(request.get("height", 9))
+        width = int(request.get("width", 9))
+        mines = mines_for(height, width, request.get("mines"), request.get("density"))
+        # Reject boards too large for the limit before a worker builds them
+        memory = board_memory(height, width)
+        if memory > self.memory_limit:
+            raise ServiceError(f"a {height}x{width} session needs at least {memory} bytes, "
+                               f"over the {self.memory_limit} byte limit")
+        session_id = next(self.ids)
+        session = Session(session_id, session_id % len(self.executors), height, width)
+        self.sessions[session_id] = session
+        async with session.lock:
+            try:
+                memory = await self._call(session, _create, session_id, height, width, mines,
+                                          request.get("seed"))
+                if memory > self.memory_limit:
+                    await self._call(session, _close, session_id)
+                    raise ServiceError(f"a {height}x{width} session needs {memory} bytes, over "
+                                       f"the {self.memory_limit} byte limit")
+            except Exception:
+                del self.sessions[session_id]
+                raise
+        return {"session": session_id, "mines": mines}
+
+    async def op_reveal(self, request):
+        session = self._session(request)
+        for cell in request["cells"]:
+            # bool is an int subclass but not a valid coordinate or count
+            if not (isinstance(cell, list) and len(cell) == 3
+                    and all(type(value) is int for value in cell)):
+                raise ServiceError(f"bad revealed cell {cell!r}: expected [i, j, count] integers")
+            i, j, count = cell
+            if not (0 <= i < session.height and 0 <= j < session.width and 0 <= count <= 8):
+                raise ServiceError(f"bad revealed cell {cell}")
+        session.pending.extend(request["cells"])
+        return {"queued": len(session.pending)}
+
+    async def op_move(self, request):
+        session = self._session(request)
+        deadline = request.get("deadline")
+        if deadline is None:
+            deadline = self.deadline
+        async with session.lock:
+            revealed = session.pending
+            session.pending = []
+            if revealed:
+                self.batched += 1
+            try:
+                return await self._call(session, _step, session.id, revealed, deadline)
+            except ServiceError:
+                # The worker closed the session
+                self.sessions.pop(session.id, None)
+                self.evicted += 1
+                raise
+
+    async def op_close(self, request):
+        session = self._session(request)
+        del self.sessions[session.id]
+        async with session.lock:
+            await self._call(session, _close, session.id)
+        return {"closed": True}
+
+    async def op_stats(self, request):
+        return self.stats()
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "batched_moves": self.batched,
+            "evicted": self.evicted,
+            "memory_limit": self.memory_limit,
+            "latency_ms": {op: {
+                "count": histogram.total,
+                "p50": histogram.percentile(50) * 1000,
+                "p99": histogram.percentile(99) * 1000,
+                "max": histogram.max * 1000,
+            } for op, histogram in sorted(self.latency.items())},
+        }
+
+    async def handle_request(self, line):
+        start = time.perf_counter()
+        op = None
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request.get("op")
+            handler = getattr(self, f"op_{op}", None) if isinstance(op, str) else None
+            if handler is None:
+                raise ServiceError(f"unknown op {op!r}")
+            response = await handler(request)
+        except Exception as error:
+            # Bad requests and worker failures are reported, not fatal
+            self.errors += 1
+            response = {"error": str(error) or type(error).__name__}
+        self.requests += 1
+        self.latency.setdefault(op if isinstance(op, str) else "invalid",
+                                LatencyHistogram()).add(time.perf_counter() - start)
+        response["id"] = request_id
+        return response
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve one client. Requests run concurrently; responses are written
+        as they complete.
+        """
+        self.connections += 1
+        tasks = set()
+
+        async def respond(line):
+            response = await self.handle_request(line)
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, path=None, host="127.0.0.1", port=8765):
+        """
+        Listen on the Unix socket path if one is given, else on host:port.
+        Returns the asyncio server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path, limit=LINE_LIMIT)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=LINE_LIMIT)
+
+
+class SolverClient:
+    """
+    Asyncio client for SolverServer. Requests may be issued concurrently
+    from many tasks over one connection.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.waiting = {}
+        self.listener = asyncio.create_task(self._listen())
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=8765):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        return cls(reader, writer)
+
+    async def _listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.waiting.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, op, **fields):
+        """
+        Send one request and return its response. Raises ServiceError if
+        the server rejected it.
+        """
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write(json.dumps(dict(fields, op=op, id=request_id)).encode() + b"\n")
+        await self.writer.drain()
+        response = await future
+        if "error" in response:
+            raise ServiceError(response["error"])
+        return response
+
+    async def new_game(self, height, width, mines=None, seed=None, density=None):
+        response = await self.request("new", height=height, width=width, mines=mines,
+                                      density=density, seed=seed)
+        return response["session"]
+
+    async def reveal(self, session, cells):
+        return await self.request("reveal", session=session,
+                                  cells=[[i, j, count] for (i, j), count in cells])
+
+    async def move(self, session, deadline=None):
+        response = await self.request("move", session=session, deadline=deadline)
+        return tuple(response["move"]) if response["move"] is not None else None
+
+    async def close_session(self, session):
+        return await self.request("close", session=session)
+
+    async def stats(self):
+        return await self.request("stats")
+
+    async def close(self):
+        self.writer.close()
+        self.listener.cancel()
+
+
+async def play_remote(client, height, width, mines, first_move, seed):
+    """
+    Play one game on a local board against a server session. Returns
+    "won", "lost" or "stuck".
+    """
+    game = Minesweeper(height=height, width=width, mines=mines, safe_cell=first_move,
+                       rng=random.Random(seed))
+    session = await client.new_game(height, width, mines, seed=seed)
+    safe_cells = height * width - mines
+    move = first_move
+    try:
+        while True:
+            cells = game.reveal(move)
+            if cells is None:
+                return "lost"
+            await client.reveal(session, cells)
+            if len(game.revealed) == safe_cells:
+                return "won"
+            move = await client.move(session)
+            if move is None or move in game.revealed:
+                return "stuck"
+    finally:
+        try:
+            await client.close_session(session)
+        except ServiceError:
+            # Already closed by the server, e.g. over its memory limit
+            pass
+
+
+async def play_many(path, host, port, games, concurrency, height, width, mines, first_move, seed):
+    client = await SolverClient.connect(path, host, port)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {"won": 0, "lost": 0, "stuck": 0, "failed": 0}
+
+    async def play(index):
+        async with semaphore:
+            try:
+                result = await play_remote(client, height, width, mines, first_move,
+                                           game_seed(seed, index))
+            except ServiceError:
+                result = "failed"
+            results[result] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(index) for index in range(games)))
+    results["wall_time"] = time.perf_counter() - start
+    results["server"] = await client.stats()
+    await client.close()
+    return results
+
+
+async def serve(server, args):
+    listener = await server.start(args.socket, args.host, args.port)
+    where = args.socket or f"{args.host}:{args.port}"
+    print(f"serving on {where}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Minesweeper AI solver service.")
+    parser.add_argument("command", choices=("serve", "play"),
+                        help="run the server, or play games against a running one")
+    parser.add_argument("--socket", help="Unix socket path (default TCP on --host/--port)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--memory-limit", type=int, default=MEMORY_LIMIT,
+                        help="bytes a session may use before it is closed")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="default smart_move time budget")
+    parser.add_argument("--games", type=int, default=100, help="games to play (play)")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="games in progress at once (play)")
+    parser.add_argument("--height", type=int, default=9)
+    parser.add_argument("--width", type=int, default=9)
+    parser.add_argument("--mines", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "play":
+        if args.mines is None and (args.height, args.width) == (9, 9):
+            args.mines = 10
+        mines = mines_for(args.height, args.width, args.mines)
+        first_move = (min(3, args.height - 1), min(3, args.width - 1))
+        results = asyncio.run(play_many(args.socket, args.host, args.port, args.games,
+                                        args.concurrency, args.height, args.width, mines,
+                                        first_move, args.seed))
+        print(json.dumps(results, indent=2))
+        return
+    server = SolverServer(args.workers, args.memory_limit, args.max_sessions, args.deadline)
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+from layout import BoardLayout
+
+# The board area of runner.py's 500 x 500 window
+AREA = (10, 10, 2 / 3 * 500 - 20, 480)
+
+
+def test_small_board_fits():
+    layout = BoardLayout(9, 9, AREA)
+    assert layout.cell_size == 34
+    assert (layout.visible_rows, layout.visible_cols) == (9, 9)
+    assert layout.cell_rect((2, 3)) == (10 + 3 * 34, 10 + 2 * 34, 34, 34)
+    assert layout.cell_at((10 + 3 * 34 + 5, 10 + 2 * 34 + 5)) == (2, 3)
+    assert layout.cell_at((5, 5)) is None
+    assert not layout.scroll(1, 1)
+
+
+def test_wide_board_stays_in_its_area():
+    layout = BoardLayout(100, 1000, AREA)
+    assert layout.cell_size == 1
+    assert layout.visible_cols == 313
+    assert layout.visible_rows == 100
+    for cell in layout.visible_cells():
+        x, y, width, height = layout.cell_rect(cell)
+        assert AREA[0] <= x and x + width <= AREA[0] + AREA[2]
+        assert AREA[1] <= y and y + height <= AREA[1] + AREA[3]
+
+
+def test_scroll_stops_at_the_edges():
+    layout = BoardLayout(100, 1000, AREA)
+    assert layout.scroll(0, 500)
+    assert (layout.top, layout.left) == (0, 500)
+    assert layout.scroll(50, 10000)
+    assert (layout.top, layout.left) == (0, 1000 - 313)
+    assert layout.visible((0, 999)) and not layout.visible((0, 0))
+    assert layout.cell_at((10, 10)) == (0, 687)
+    assert layout.scroll(0, -10000)
+    assert layout.left == 0
+
+
+def test_regions_cover_the_dirty_cells_within_the_limit():
+    layout = BoardLayout(300, 300, (0, 0, 300, 300))
+    dirty = {(i, j) for i in range(300) for j in range(300) if (i + j) % 3 == 0}
+    regions = layout.regions(dirty, 256)
+    assert len(regions) <= 256
+    assert sorted(cell for _, cells in regions for cell in cells) == sorted(dirty)
+    for (x, y, width, height), cells in regions:
+        assert x + width <= 300 and y + height <= 300
+        for cell in cells:
+            cx, cy, _, _ = layout.cell_rect(cell)
+            assert x <= cx < x + width and y <= cy < y + height
+
+
+def test_regions_skip_cells_outside_the_viewport():
+    layout = BoardLayout(10, 1000, AREA)
+    regions = layout.regions({(0, 0), (0, 999)}, 256)
+    assert regions == [(layout.cell_rect((0, 0)), [(0, 0)])]
+    assert len(layout.regions({(i, 0) for i in range(10)}, 1)) == 1